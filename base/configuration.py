@@ -1,19 +1,68 @@
 # base/configuration.py
 
+from collections import defaultdict
+from itertools import permutations, product
+import copy
+import pickle
+import zlib
+
+from base.monitor import Monitor
+from base.process import copy_state
+
+def _freeze(value, pid_map=None):
+    # hashable, totally ordered form of a state value; every leaf becomes its repr,
+    # and pids are renamed through pid_map when one is given
+    if isinstance(value, dict):
+        return tuple(sorted((_freeze(k, pid_map), _freeze(v, pid_map)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v, pid_map) for v in value)
+    if pid_map is not None and isinstance(value, str) and value in pid_map:
+        value = pid_map[value]
+    return repr(value)
+
 class Configuration:
     _config_counter = 0
     
-    def __init__(self, processes, message_system):
+    def __init__(self, processes, message_system, rng=None, check_invariants=False):
         self.id = f"C{Configuration._config_counter}"
         Configuration._config_counter += 1
         
         self.processes = {p.pid: p for p in processes}
         self.message_system = message_system
+        self.rng = rng if rng is not None else message_system.rng #shared with the message system by default
         self.round = 0
-        self.doen = 0 #number of processes that are in decision state
+        self.monitor = Monitor(self.processes.values(), check=check_invariants) #decision/round counters, see base/monitor.py
+        self.dirty = set() #pids whose state changed since the last snapshot
+        self.handler_args = None #{'n', 't'} of the protocol run on it, set by main.build_ben_or
+        
+    def fork(self):
+        # cheap branch of this configuration: process states and message queues are shared
+        # copy-on-write, so only what a branch actually touches gets copied
+        child = Configuration.__new__(Configuration)
+        child.__dict__.update(self.__dict__)
+        child.processes = {pid: p.fork() for pid, p in self.processes.items()}
+        child.message_system = self.message_system.fork()
+        child.monitor = self.monitor.fork()
+        if self.rng is self.message_system.rng:
+            child.rng = child.message_system.rng
+        else:
+            child.rng = copy.copy(self.rng)
+        child.dirty = set()
+        return child
+    
+    def checkpoint(self, path):
+        # compressed pickle of the whole configuration, rng state included
+        with open(path, "wb") as f:
+            f.write(zlib.compress(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)))
+            
+    @staticmethod
+    def restore(path):
+        # only restore checkpoints you wrote yourself: this unpickles the file
+        with open(path, "rb") as f:
+            return pickle.loads(zlib.decompress(f.read()))
         
     def decision_values(self):
-        return {p.y for p in self.processes.values() if p.y in [0, 1]}
+        return self.monitor.decision_values()
     
     def snapshot(self):
         # document about current configuration summary
@@ -25,16 +74,59 @@ class Configuration:
         lines.extend(f"    {line}" for line in buffer_summary)
         return "\n".join(lines)
     
-    def get_state_summary(self):
+    def get_state_summary(self, pids=None):
+        # full summary by default, or only the given pids (delta snapshots)
         summary = {}
-        for pid, p in self.processes.items():
+        for pid in (self.processes if pids is None else pids):
+            p = self.processes[pid]
             summary[pid] = {
                 'x': p.x,
                 'y': p.y,
                 'alive': p.alive,
-                'state': p.state.copy()
+                'state': copy_state(p.peek_state())
             }
         return summary
     
+    def fingerprint(self, pid_map=None):
+        # canonical key: process states plus each buffer as a multiset (delivery order ignored)
+        procs = sorted(
+            (_freeze(pid, pid_map), repr(p.x), repr(p.y), repr(p.alive), _freeze(p.peek_state(), pid_map))
+            for pid, p in self.processes.items())
+        buffers = sorted(
+            (_freeze(receiver, pid_map), tuple(sorted(_freeze(m, pid_map) for m in queue)))
+            for receiver, queue in self.message_system.peek_buffer().items() if queue)
+        return (tuple(procs), tuple(buffers))
+    
+    def pid_permutations(self):
+        # relabelings that only swap processes with the same input and liveness
+        classes = defaultdict(list)
+        for pid, p in self.processes.items():
+            classes[(repr(p.input), p.alive)].append(pid)
+        groups = list(classes.values())
+        perms = []
+        for images in product(*(permutations(group) for group in groups)):
+            pid_map = {}
+            for group, image in zip(groups, images):
+                pid_map.update(zip(group, image))
+            perms.append(pid_map)
+        return perms
+    
+    def canonical_fingerprint(self, perms):
+        # lexicographically smallest fingerprint over perms, with the relabeling that produced it
+        best_key, best_map = None, None
+        for pid_map in perms:
+            key = self.fingerprint(pid_map)
+            if best_key is None or key < best_key:
+                best_key, best_map = key, pid_map
+        return best_key, best_map
+    
+    def mark_dirty(self, pid):
+        self.dirty.add(pid)
+        
+    def pop_dirty(self):
+        dirty = self.dirty
+        self.dirty = set()
+        return dirty
+    
     def all_decided(self):
-        return all(p.y in [0, 1] for p in self.processes.values())
\ No newline at end of file
+        return self.monitor.all_decided()
\ No newline at end of file
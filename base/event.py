@@ -11,8 +11,10 @@ class Event:
         
         process = config.processes[self.pid] # process object
         
+        active = logger.active if logger is not None else () #enabled log categories
+        
         if not process.alive:
-            if logger:
+            if 'receive' in active:
                 logger.log_event({
                     "type": "skipped",
                     "pid": self.pid,
@@ -21,18 +23,23 @@ class Event:
             
             return False
         
-        logger.log_event({
-            "type": "receive",
-            "pid": self.pid,
-            "message": self.message
-        })
+        if 'receive' in active:
+            logger.log_event({
+                "type": "receive",
+                "pid": self.pid,
+                "message": self.message
+            })
             
         # delegate a handler
+        monitor = config.monitor
+        before = monitor.watch(process)
         round_advanced = handler(
             config, process, self.message,
             handler_args=handler_args,
             logger=logger,
             animate=animate)
+        monitor.observe(process, before)
+        config.mark_dirty(self.pid)
         
         config.round += 1
         config.id = f"C{config.round}"
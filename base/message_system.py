@@ -1,37 +1,376 @@
 # base/message_system.py
 
+import bisect
+import copy
+import heapq
 import random
-from collections import defaultdict
+from collections import defaultdict, deque
+
+CLOSED = float('inf') #floor of a receiver that takes no more messages (see close())
 
 class MessageSystem:
-    def __init__(self):
-        self.buffer = defaultdict(list)
+    def __init__(self, rng=None):
+        self.buffer = defaultdict(deque) #per-receiver FIFO queues
+        self.rng = rng if rng is not None else random.Random()
+        self._ready = [] #receivers with at least one pending message
+        self._ready_pos = {} #receiver -> index in self._ready
+        self._owned = None #after a fork: receivers whose queue is private to this system, None = all
+        self.send_hooks = [] #hook(receiver, message) called on every send (utils/schedule.py)
+        self.floor = {} #receiver -> lowest message round still delivered to it
+        self._depth = 0 #messages queued over all receivers
+        
+    def fork(self):
+        #copy-on-write branch: queues are shared until either side writes to them
+        child = copy.copy(self)
+        child.buffer = defaultdict(deque, self.buffer)
+        child.rng = copy.copy(self.rng)
+        child._ready = list(self._ready)
+        child._ready_pos = dict(self._ready_pos)
+        child._owned = set()
+        child.send_hooks = [] #a fork is scheduled on its own
+        child.floor = dict(self.floor)
+        self._owned = set()
+        return child
+    
+    def _own(self, receiver):
+        #take a private copy of a shared queue before mutating it
+        if self._owned is not None and receiver not in self._owned:
+            if receiver in self.buffer:
+                self.buffer[receiver] = deque(self.buffer[receiver])
+            self._owned.add(receiver)
         
     def send(self, receiver, message):
-        #add messages to buffer in asynchronous way
+        #add messages to buffer in asynchronous way; messages are (sender, type, round, value)
+        #and those for a round the receiver has already left are dropped right away
+        if message[2] < self.floor.get(receiver, 0):
+            return
+        self._own(receiver)
         self.buffer[receiver].append(message)
+        self._depth += 1
+        if receiver not in self._ready_pos:
+            self._mark_ready(receiver)
+        if self.send_hooks:
+            for hook in self.send_hooks:
+                hook(receiver, message)
+        
+    def broadcast(self, receivers, message):
+        #fan one payload object out to every receiver: the queues hold references to the
+        #same tuple, so a broadcast allocates no per-receiver copies. Each receiver's
+        #queue is still independent and may deliver it at any point of its own order
+        buffer = self.buffer
+        owned = self._owned
+        ready_pos = self._ready_pos
+        floor = self.floor
+        if floor:
+            receivers = [r for r in receivers if message[2] >= floor.get(r, 0)]
+        for receiver in receivers:
+            if owned is not None and receiver not in owned:
+                self._own(receiver)
+            buffer[receiver].append(message)
+            if receiver not in ready_pos:
+                self._mark_ready(receiver)
+        self._depth += len(receivers)
+        if self.send_hooks:
+            for receiver in receivers:
+                for hook in self.send_hooks:
+                    hook(receiver, message)
+        
+    def advance_floor(self, receiver, round):
+        #receiver has moved on to `round`: drop its queued messages from earlier rounds
+        #now and any sent later, so it is never scheduled for dead traffic
+        if self.floor.get(receiver, 0) >= round:
+            return
+        self.floor[receiver] = round
+        queue = self.buffer.get(receiver)
+        if queue:
+            kept = deque(m for m in queue if m[2] >= round)
+            if len(kept) != len(queue):
+                self._depth -= len(queue) - len(kept)
+                self.buffer[receiver] = kept
+                if self._owned is not None:
+                    self._owned.add(receiver)
+                if not kept:
+                    self._unmark_ready(receiver)
+        
+    def close(self, receiver):
+        #quiescence for a decided process: nothing is queued for it or scheduled to it anymore
+        self.advance_floor(receiver, CLOSED)
         
     def receive(self, receiver):
         #request to receive message indeterministically
-        if receiver not in self.buffer or not self.buffer[receiver]:
+        queue = self.buffer.get(receiver)
+        if not queue:
             return None #buffer empty
 
-        if random.random() < 0.7:
-            return self.buffer[receiver].pop(0)
+        if self.rng.random() < 0.7:
+            self._own(receiver)
+            queue = self.buffer[receiver]
+            message = queue.popleft()
+            self._depth -= 1
+            if not queue:
+                self._unmark_ready(receiver)
+            return message
         else:
             return None
         
+    def take(self, receiver, index=0):
+        #deliver a specific pending message (FLP: any buffered message may be next)
+        queue = self.buffer.get(receiver)
+        if not queue:
+            return None
+        self._own(receiver)
+        queue = self.buffer[receiver]
+        message = queue[index]
+        del queue[index]
+        self._depth -= 1
+        if not queue:
+            self._unmark_ready(receiver)
+        return message
+        
+    def choose_ready(self):
+        #pick a receiver uniformly among those with pending messages, None if nothing is in flight
+        if not self._ready:
+            return None
+        return self._ready[self.rng.randrange(len(self._ready))]
+    
+    def ready_receivers(self):
+        return list(self._ready)
+    
+    def pending(self, receiver):
+        return len(self.buffer.get(receiver, ()))
+    
+    def has_pending(self):
+        return bool(self._ready)
+    
+    def depth(self):
+        #messages in flight over all receivers, O(1)
+        return self._depth
+    
+    def _mark_ready(self, receiver):
+        self._ready_pos[receiver] = len(self._ready)
+        self._ready.append(receiver)
+        
+    def _unmark_ready(self, receiver):
+        #swap with the last ready receiver so removal stays O(1)
+        pos = self._ready_pos.pop(receiver)
+        last = self._ready.pop()
+        if last != receiver:
+            self._ready[pos] = last
+            self._ready_pos[last] = pos
+        
     def peek_buffer(self, receiver=None):
         if receiver:
-            return self.buffer.get(receiver, [])
+            return self.buffer.get(receiver, deque())
         return dict(self.buffer)
     
     def all_receivers(self):
         return list(self.buffer.keys())
     
+    def timing(self):
+        #untimed: nothing beyond the queues decides what happens next (see DelayedMessageSystem)
+        return None
+    
     def snapshot(self):
         summary = []
         for receiver, messages in self.buffer.items():
             for msg in messages: #msg : (sender, msg_type, msg_round, msg_value)
                 summary.append(f"{msg[0]} → {receiver}: {msg[1:]}")
-        return summary or ["[Empty buffer]"]
\ No newline at end of file
+        return summary or ["[Empty buffer]"]
+
+
+#delay distributions: callables drawing a delivery delay from the system's rng
+class ConstantDelay:
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        
+    def __call__(self, rng):
+        return self.delay
+    
+class UniformDelay:
+    def __init__(self, low=0.0, high=1.0):
+        self.low = low
+        self.high = high
+        
+    def __call__(self, rng):
+        return rng.uniform(self.low, self.high)
+    
+class ExponentialDelay:
+    def __init__(self, mean=1.0):
+        self.mean = mean
+        
+    def __call__(self, rng):
+        return rng.expovariate(1.0 / self.mean)
+    
+class DelayedMessageSystem(MessageSystem):
+    #discrete-event variant: every send is stamped with a delivery time and
+    #next_delivery() jumps the clock straight to the earliest pending message.
+    #pending messages are indexed twice: a global heap of (deliver_at, seq, receiver,
+    #message) and, per receiver, a list of (deliver_at, seq, message) sorted the same
+    #way, so take(receiver, i), pending() and peek_buffer(receiver) only ever touch that
+    #receiver's messages. Entries that leave a receiver list (take, advance_floor) stay
+    #in the heap with their seq marked gone until they surface; self.buffer stays empty
+    def __init__(self, delay=None, rng=None):
+        super().__init__(rng)
+        self.delay = delay if delay is not None else ExponentialDelay()
+        #delays get their own stream: they depend only on the order of sends, not on
+        #coin or scheduling draws, so a recorded schedule replays with the same timings
+        self.delay_rng = random.Random(self.rng.getrandbits(64))
+        self.clock = 0.0
+        self._events = [] #heap of (deliver_at, seq, receiver, message)
+        self._seq = 0 #tie-breaker keeping equal timestamps in send order
+        self._queues = {} #receiver -> its pending (deliver_at, seq, message), earliest first
+        self._gone = set() #seqs still in the heap but no longer pending
+        self._events_shared = False #heap shared with a fork, copied before the next write
+        
+    def fork(self):
+        child = super().fork()
+        child.delay_rng = copy.copy(self.delay_rng)
+        child._queues = dict(self._queues)
+        child._gone = set(self._gone)
+        child._events_shared = self._events_shared = True
+        return child
+    
+    def _own_events(self):
+        if self._events_shared:
+            self._events = list(self._events)
+            self._events_shared = False
+            
+    def _own_queue(self, receiver):
+        #receiver lists are shared with forks like MessageSystem queues
+        if self._owned is not None and receiver not in self._owned:
+            if receiver in self._queues:
+                self._queues[receiver] = list(self._queues[receiver])
+            self._owned.add(receiver)
+        
+    def send(self, receiver, message):
+        if message[2] < self.floor.get(receiver, 0):
+            return
+        self._own_events()
+        deliver_at = self.clock + self.delay(self.delay_rng)
+        seq = self._seq
+        self._seq += 1
+        heapq.heappush(self._events, (deliver_at, seq, receiver, message))
+        self._own_queue(receiver)
+        queue = self._queues.setdefault(receiver, [])
+        entry = (deliver_at, seq, message)
+        if queue and entry < queue[-1]:
+            bisect.insort(queue, entry)
+        else:
+            queue.append(entry)
+        if receiver not in self._ready_pos:
+            self._mark_ready(receiver)
+        if self.send_hooks:
+            for hook in self.send_hooks:
+                hook(receiver, message)
+        
+    def broadcast(self, receivers, message):
+        #one heap entry per receiver, each with its own delay, all sharing the payload
+        for receiver in receivers:
+            self.send(receiver, message)
+            
+    def _remove(self, receiver, index):
+        #take the index-th entry off receiver's list; the heap is left to the caller
+        self._own_queue(receiver)
+        queue = self._queues[receiver]
+        entry = queue.pop(index)
+        if not queue:
+            del self._queues[receiver]
+            self._unmark_ready(receiver)
+        return entry
+    
+    def _drop_gone_head(self):
+        #pop entries that are no longer pending off the top of the heap
+        events, gone = self._events, self._gone
+        while events and events[0][1] in gone:
+            self._own_events()
+            events = self._events
+            gone.discard(heapq.heappop(events)[1])
+            
+    def _forget(self, seqs):
+        #mark heap entries gone; rebuild the heap once they are the majority of it
+        self._gone.update(seqs)
+        if len(self._gone) > 64 and 2 * len(self._gone) > len(self._events):
+            gone = self._gone
+            self._events = [event for event in self._events if event[1] not in gone]
+            heapq.heapify(self._events)
+            self._events_shared = False
+            self._gone = set()
+        
+    def next_delivery(self):
+        #pop the earliest message, None once nothing is in flight
+        self._drop_gone_head()
+        if not self._events:
+            return None
+        self._own_events()
+        deliver_at, _, receiver, message = heapq.heappop(self._events)
+        self.clock = deliver_at
+        self._remove(receiver, 0) #the globally earliest message heads its receiver's list
+        return receiver, message
+    
+    def next_receiver(self):
+        #receiver of the earliest pending message, None once nothing is in flight
+        self._drop_gone_head()
+        return self._events[0][2] if self._events else None
+    
+    def advance_floor(self, receiver, round):
+        if self.floor.get(receiver, 0) >= round:
+            return
+        self.floor[receiver] = round
+        queue = self._queues.get(receiver)
+        if not queue:
+            return
+        kept = [entry for entry in queue if entry[2][2] >= round]
+        if len(kept) == len(queue):
+            return
+        dropped = [entry[1] for entry in queue if entry[2][2] < round]
+        if kept:
+            self._queues[receiver] = kept
+            if self._owned is not None:
+                self._owned.add(receiver)
+        else:
+            del self._queues[receiver]
+            self._unmark_ready(receiver)
+        self._forget(dropped)
+    
+    def receive(self, receiver):
+        #polling a single receiver hands over its earliest-due message
+        return self.take(receiver, 0)
+    
+    def take(self, receiver, index=0):
+        #index counts the receiver's pending messages in delivery-time order
+        if not self._queues.get(receiver):
+            return None
+        deliver_at, seq, message = self._remove(receiver, index)
+        self.clock = max(self.clock, deliver_at)
+        self._forget((seq,))
+        self._drop_gone_head()
+        return message
+            
+    def pending_events(self):
+        return len(self._events) - len(self._gone)
+    
+    def depth(self):
+        return self.pending_events()
+    
+    def pending(self, receiver):
+        return len(self._queues.get(receiver, ()))
+    
+    def peek_buffer(self, receiver=None):
+        if receiver:
+            return deque(entry[2] for entry in self._queues.get(receiver, ()))
+        return {r: deque(entry[2] for entry in queue) for r, queue in self._queues.items()}
+    
+    def all_receivers(self):
+        return list(self._queues.keys())
+    
+    def timing(self):
+        #what a continuation's delays depend on besides the delay stream: the clock and
+        #every pending message with its due time, in a canonical order
+        return self.clock, tuple(sorted((deliver_at, receiver, msg) for receiver, queue in self._queues.items()
+                                        for deliver_at, _, msg in queue))
+    
+    def snapshot(self):
+        entries = sorted((deliver_at, seq, receiver, msg) for receiver, queue in self._queues.items()
+                         for deliver_at, seq, msg in queue)
+        summary = [f"{msg[0]} → {receiver} @ {deliver_at:.3f}: {msg[1:]}" for deliver_at, _, receiver, msg in entries]
+        return summary or ["[Empty buffer]"]
@@ -0,0 +1,102 @@
+# base/monitor.py
+
+from collections import Counter
+
+class InvariantViolation(Exception):
+    # raised by Monitor the moment a safety property breaks; the run it happens in is aborted
+    def __init__(self, invariant, pid, message):
+        super().__init__(message)
+        self.invariant = invariant #'agreement', 'validity' or 'integrity'
+        self.pid = pid
+        self.step = None #set by main.run_steps
+
+class Monitor:
+    # incremental view of a configuration, updated by Event.apply (and the future-message
+    # drain of protocols/ben_or.py) from what one step changed in one process:
+    # decided count, per-value decision counts and a histogram of process rounds, so every
+    # query is O(1). With check=True a decision that breaks agreement (two values),
+    # validity (a value nobody proposed) or integrity (a decision changed) raises
+    def __init__(self, processes, check=False):
+        processes = list(processes)
+        self.n = len(processes)
+        self.check = check
+        self.inputs = {p.input for p in processes}
+        self.values = [0, 0] #decided processes per value
+        self.rounds = Counter(p.peek_state().get('round', 1) for p in processes)
+        self.min_round = min(self.rounds, default=1)
+        self.max_round = max(self.rounds, default=1)
+        for p in processes:
+            if p.y in (0, 1):
+                self.values[p.y] += 1
+
+    def fork(self):
+        child = Monitor.__new__(Monitor)
+        child.__dict__.update(self.__dict__)
+        child.values = list(self.values)
+        child.rounds = Counter(self.rounds)
+        return child
+
+    @property
+    def decided(self):
+        return self.values[0] + self.values[1]
+
+    def all_decided(self):
+        return self.values[0] + self.values[1] == self.n
+
+    def decision_values(self):
+        return {v for v in (0, 1) if self.values[v]}
+
+    def watch(self, process):
+        # what observe() compares against, taken before the step
+        return process.y, process.peek_state().get('round', 1)
+
+    def observe(self, process, before):
+        y, r = before
+        if process.y != y:
+            self._decided(process, y)
+        new_r = process.peek_state().get('round', 1)
+        if new_r != r:
+            self._moved(r, new_r)
+
+    def _decided(self, process, previous):
+        value = process.y
+        if previous in (0, 1):
+            self.values[previous] -= 1
+        if value in (0, 1):
+            self.values[value] += 1
+        if not self.check:
+            return
+        if previous in (0, 1):
+            raise InvariantViolation('integrity', process.pid,
+                                     f"{process.pid} changed its decision from {previous} to {value!r}")
+        if value not in self.inputs:
+            raise InvariantViolation('validity', process.pid,
+                                     f"{process.pid} decided {value}, which no process proposed")
+        if self.values[1 - value]:
+            raise InvariantViolation('agreement', process.pid,
+                                     f"{process.pid} decided {value} after {self.values[1 - value]} process(es) decided {1 - value}")
+
+    def _moved(self, old, new):
+        rounds = self.rounds
+        rounds[old] -= 1
+        if not rounds[old]:
+            del rounds[old]
+        rounds[new] += 1
+        if new > self.max_round:
+            self.max_round = new
+        if new < self.min_round:
+            self.min_round = new
+        elif old == self.min_round and old not in rounds:
+            # rounds only grow, so the minimum moves up at most max_round times in a run
+            while self.min_round not in rounds:
+                self.min_round += 1
+
+    def summary(self, config):
+        return {
+            'decided': self.decided,
+            'decided_0': self.values[0],
+            'decided_1': self.values[1],
+            'min_round': self.min_round,
+            'max_round': self.max_round,
+            'buffer_depth': config.message_system.depth()
+        }
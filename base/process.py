@@ -4,11 +4,44 @@ class Process:
     def __init__(self, pid, input_value, live=True):
         self.pid = pid
         self.x = input_value
+        self.input = input_value #x changes across rounds, the original input is kept
         self.y = 'b' #undecided, blank
         self.alive = live
-        self.state = {}
+        self._state = {}
+        self._shared = False #state dict shared with a fork, copied before it is handed out
         self.pc = 0
         
+    @property
+    def state(self):
+        # copy-on-write: the first access after a fork takes a private copy
+        if self._shared:
+            self._state = copy_state(self._state)
+            self._shared = False
+        return self._state
+    
+    @state.setter
+    def state(self, value):
+        self._state = value
+        self._shared = False
+        
+    def peek_state(self):
+        # read-only view that never copies; callers must not mutate it
+        return self._state
+    
+    def fork(self):
+        child = Process.__new__(Process)
+        child.__dict__.update(self.__dict__)
+        child._shared = self._shared = True
+        return child
+        
     def __repr__(self):
         return (f"Process({self.pid}, x={self.x}, y={self.y}, "
-                f"state={self.state}, alive={self.alive}")
+                f"state={self._state}, alive={self.alive}")
+
+def copy_state(state):
+    #copy containers all the way down; messages are tuples and can be shared
+    if isinstance(state, dict):
+        return {k: copy_state(v) for k, v in state.items()}
+    if isinstance(state, list):
+        return [copy_state(v) for v in state]
+    return state
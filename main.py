@@ -1,68 +1,176 @@
 # main.py
 
 from base.process import Process
-from base.message_system import MessageSystem
+from base.message_system import MessageSystem, DelayedMessageSystem
 from base.configuration import Configuration
 from base.event import Event
+from base.monitor import InvariantViolation
 from protocols.ben_or import ben_or_handler, inject_future_messages
 from utils.logger import SimulationLogger
+from utils.binlog import BinaryLogWriter
 
 import random
 
-def simulate_ben_or(n=3, t=1, rounds=30, seed=None, log_enabled=True):
-    if seed is not None:
-        random.seed(seed)
+def summarize_run(config, steps, seed=None, violation=None):
+    # per-run result used by the batch runner (utils/batch.py); O(1) through config.monitor
+    values = config.decision_values()
+    decided = config.all_decided()
+    return {
+        'seed': seed,
+        'decided': decided,
+        'steps': steps,
+        'rounds': config.monitor.max_round,
+        'decision_values': sorted(values),
+        'agreement_violation': len(values) > 1,
+        'invariant_violation': None if violation is None else violation.invariant
+    }
+
+def run_steps(config, handler_args, max_steps, logger, on_step=None, scheduler=None, record=None):
+    # drive config for up to max_steps deliveries; returns the number of steps taken.
+    # on_step(config, step) is called after every step (used by utils/valence.py)
+    # record.delivery(pid, index) is called with every delivery (utils/replay.py)
+    # scheduler.next_event(config) replaces the built-in delivery policy: it returns
+    # (pid, index) to deliver that pid's index-th pending message, (pid, None) for a
+    # step without delivery, or None to stop
+    message_system = config.message_system
+    timed = isinstance(message_system, DelayedMessageSystem)
+    steps = 0
+    for step in range(max_steps):
+        if scheduler is not None:
+            choice = scheduler.next_event(config)
+            if choice is None:
+                logger.final("Scheduler stopped")
+                break
+            target, index = choice
+            msg = message_system.take(target, index) if index is not None else None
+            if msg is None:
+                index = None
+        elif timed:
+            # discrete-event mode: every step delivers the next due message
+            delivery = message_system.next_delivery()
+            if delivery is None:
+                logger.final("No pending messages")
+                break
+            target, msg = delivery
+            index = 0 #the earliest message is also the head of its receiver's queue
+        else:
+            # only receivers with pending messages are scheduled
+            target = message_system.choose_ready()
+            if target is None:
+                logger.final("No pending messages")
+                break
+            msg = message_system.receive(target)
+            index = 0 if msg is not None else None
+        steps = step + 1
+        if record is not None:
+            record.delivery(target, index)
+        
+        # checked per step: a scheduler may switch logging on mid-run (utils/replay.py)
+        if 'delivery' in logger.active:
+            logger.log_event({
+                "type": "delivery_attemp",
+                "receiver": target,
+                "message": msg
+            })
+        
+        event = Event(target, msg)
+        try:
+            round_advanced = event.apply(config, handler=ben_or_handler, handler_args=handler_args, logger=logger)
+            if round_advanced:
+                inject_future_messages(config, target, logger, handler_args)
+        except InvariantViolation as error:
+            error.step = steps
+            raise
+            
+        logger.snapshot_config(config)
+        if on_step is not None:
+            on_step(config, steps)
+            
+        if config.all_decided():
+            logger.final("All processes decided")
+            break
+    return steps
+
+def build_ben_or(n=3, t=1, seed=None, delay=None, logger=None, scheduler=None, check_invariants=False):
+    # initial configuration of a seeded run with the round-1 votes in flight;
+    # scheduler (utils/schedule.py) is attached before the first send
+    # check_invariants: abort with InvariantViolation on the first unsafe decision (base/monitor.py)
+    # every random draw of the run goes through this instance, so runs never share global state
+    rng = random.Random(seed)
         
     if not(0 <= t and n > 2*t):
         raise ValueError(f"Invalid parameters : Ben-Or requires n > 2t and t ≥ 0. Got n={n}, t={t}")
     handler_args = {'n': n, 't' : t}
         
     # 1. Generate processes & message system
-    processes = [Process(f'P{i+1}', input_value=random.choice([0,1])) for i in range(n)]
-    message_system = MessageSystem()
-    config = Configuration(processes, message_system)
+    processes = [Process(f'P{i+1}', input_value=rng.choice([0,1])) for i in range(n)]
+    # a delay distribution switches to the discrete-event message system
+    if delay is not None:
+        message_system = DelayedMessageSystem(delay=delay, rng=rng)
+    else:
+        message_system = MessageSystem(rng=rng)
+    config = Configuration(processes, message_system, rng=rng, check_invariants=check_invariants)
+    config.handler_args = handler_args
+    if scheduler is not None:
+        scheduler.attach(config)
+    log_sends = logger is not None and logger.wants('send')
     
-    # 2. log setting
-    logger = SimulationLogger(enabled=log_enabled)
-    
-    # 3. Primary broadcast (input value based)
+    # 2. Primary broadcast (input value based)
     for p in config.processes.values():
-        for target in config.processes:
-            if target != p.pid:
-                message_system.send(target, (p.pid, 'vote', 1, p.x))
-                logger.log_event({
-                    "type": "send_initial_broadcast",
-                    "from": p.pid,
-                    "to": target,
-                    "value": p.x
-                })
-                    
-    # 4. Simulate event
-    process_ids = list(config.processes.keys())
-    for step in range(rounds):
-        target = random.choice(process_ids)
-        msg = message_system.receive(target)   
-        
-        logger.log_event({
-            "type": "delivery_attemp",
-            "receiver": target,
-            "message": msg
-        })
-        
-        event = Event(target, msg)
-        round_advanced = event.apply(config, handler=ben_or_handler, handler_args=handler_args, logger=logger)
+        message_system.broadcast([target for target in config.processes if target != p.pid], (p.pid, 'vote', 1, p.x))
+        if log_sends:
+            logger.log_event({
+                "type": "send_initial_broadcast",
+                "from": p.pid,
+                "to": "*",
+                "value": p.x
+            })
+    return config, handler_args
+
+def simulate_ben_or(n=3, t=1, rounds=30, seed=None, log_enabled=True, log_path="simulation_log.json", delay=None,
+                    log_categories=None, on_step=None, scheduler=None, record=None, check_invariants=True):
+    # 1. log setting (.jsonl and .bin paths stream entries to disk as they happen)
+    streaming = log_enabled and log_path is not None and log_path.endswith((".jsonl", ".bin"))
+    sink = None
+    if streaming:
+        sink = BinaryLogWriter(log_path) if log_path.endswith(".bin") else log_path
+    logger = SimulationLogger(enabled=log_enabled, sink=sink, categories=log_categories)
+    
+    # a recorded run needs a concrete seed to rebuild its initial configuration from
+    if record is not None and seed is None:
+        seed = random.SystemRandom().getrandbits(64)
         
-        if round_advanced:
-            inject_future_messages(config, target, logger)
-            
-        logger.snapshot(config.get_state_summary())
+    # the sink is closed on every way out, Ctrl-C included, so a streamed log keeps its
+    # tail (and a .bin log gets its sidecar) whatever stopped the run
+    try:
+        # 2. processes, message system and primary broadcast
+        config, handler_args = build_ben_or(n, t, seed, delay, logger, scheduler, check_invariants)
+        # a ScheduleRecord (utils/replay.py) captures deliveries and coin flips for replay
+        if record is not None:
+            record.attach(config, n=n, t=t, seed=seed)
+                        
+        # 4. Simulate event; a broken invariant stops the run where it happened
+        violation = None
+        try:
+            steps = run_steps(config, handler_args, rounds, logger, on_step, scheduler, record)
+        except InvariantViolation as error:
+            violation = error
+            steps = error.step
+            logger.log_event({
+                "type": "invariant_violation",
+                "invariant": error.invariant,
+                "pid": error.pid,
+                "message": str(error)
+            })
+            logger.final(f"Invariant violated: {error}")
             
-        if config.all_decided():
-            logger.final("All processes decided")
-            break
+        # 5. print log
+        if not streaming and log_path is not None:
+            logger.export_as_json(log_path)
+    finally:
+        logger.close()
         
-    # 5. print log
-    logger.export_as_json("simulation_log.json")
+    return summarize_run(config, steps, seed, violation)
                 
 if __name__=="__main__":
     simulate_ben_or(rounds=300, log_enabled=True)
\ No newline at end of file
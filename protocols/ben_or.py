@@ -1,182 +1,264 @@
 # protocols/ben_or.py
-from base.event import Event
-import random
 
-def majority_value(n, votes_list):
-    if votes_list.count(0) > n//2:
+DECISION_SLOT = {0: 0, 1: 1, '?': 2} #index of a decide value in state['decision_count']
+
+def majority_value(n, vote_count):
+    # vote_count: [#votes for 0, #votes for 1] of the current round
+    if vote_count[0] > n//2:
         return 0
-    elif votes_list.count(1) > n//2:
+    elif vote_count[1] > n//2:
         return 1
     else:
         return None
             
+def send_decision(config, process, r, n, vote_count, logger=None, active=()):
+    # broadcast this process's round-r decide from its n-t votes (one per round)
+    majority = majority_value(n, vote_count)
+    decision = majority if majority is not None else '?'
+    decision_msg = (process.pid, 'decide', r, decision)
+    config.message_system.broadcast([target for target in config.processes if target != process.pid], decision_msg)
+    if 'send' in active:
+        # one entry per broadcast; "to": "*" stands for every other process
+        logger.log_event({
+            "type": "send_decision",
+            "from": process.pid,
+            "to": "*",
+            "round": r,
+            "value": decision
+        })
+    vote_count[0] = vote_count[1] = 0
+    process.state['decide_sent'] = r
+
 def ben_or_handler(config, process, message, handler_args=None, t=1, logger=None, animate=None):
     #according to "Another Advantage of Free Choice: Completely Asynchronous Agreement Protocols"    
     n = handler_args.get('n', len(config.processes))
     t = handler_args.get('t', 1)
     state = process.state
     state.setdefault('round', 1)
-    state.setdefault('votes', [])
-    state.setdefault('decisions', [])
-    state.setdefault('future', {})
+    # per-round tallies instead of message lists: O(1) work and memory per message
+    state.setdefault('vote_count', [0, 0])
+    state.setdefault('decision_count', [0, 0, 0]) # 0, 1, '?'
+    state.setdefault('first_decision', None) # first non-'?' decide value seen this round
+    state.setdefault('future', {}) # round -> {'messages': [...], 'vote': #stored, 'decide': #stored}
+    state.setdefault('decide_sent', 0) # last round this process broadcast its decide in
+    active = logger.active if logger is not None else () #enabled log categories
     
     r= state['round']
     round_advanced = False
     
     # already decided
-    if process.y in ['0', '1']:
-        logger.log_event({
-            "type": "already_decided",
-            "pid": process.pid,
-            "round": r,
-            "value": process.y
-        })
+    if process.y in (0, 1):
+        if 'decision' in active:
+            logger.log_event({
+                "type": "already_decided",
+                "pid": process.pid,
+                "round": r,
+                "value": process.y
+            })
         return round_advanced
     
     # 1. receive message 
     if message:
         sender, msg_type, msg_round, msg_value = message
         if msg_round < r:
-            logger.log_event({
-                "type": "ignore_old_message",
-                "pid": process.pid,
-                "round": r,
-                "message_round": msg_round,
-                "from": sender
-            })
+            if 'buffer' in active:
+                logger.log_event({
+                    "type": "ignore_old_message",
+                    "pid": process.pid,
+                    "round": r,
+                    "message_round": msg_round,
+                    "from": sender
+                })
             return round_advanced
         if msg_round > r:
-            state['future'].setdefault(msg_round, []).append(message)
-            logger.log_event({
-                "type": "store_future_message",
-                "pid": process.pid,
-                "store_round": msg_round,
-                "from": sender
-            })
+            # only the first n-t votes and n-t decides of a round can change anything,
+            # so a slow process keeps at most 2(n-t) messages per future round
+            pending = state['future'].setdefault(msg_round, {'messages': [], 'vote': 0, 'decide': 0})
+            if pending[msg_type] >= n - t:
+                if 'buffer' in active:
+                    logger.log_event({
+                        "type": "drop_future_message",
+                        "pid": process.pid,
+                        "store_round": msg_round,
+                        "from": sender
+                    })
+                return round_advanced
+            pending[msg_type] += 1
+            pending['messages'].append(message)
+            if 'buffer' in active:
+                logger.log_event({
+                    "type": "store_future_message",
+                    "pid": process.pid,
+                    "store_round": msg_round,
+                    "from": sender
+                })
             return round_advanced
         if msg_type == 'vote':
-            state['votes'].append(msg_value)
-            logger.log_event({
-                "type": "receive_vote",
-                "pid": process.pid,
-                "round": r,
-                "from": sender,
-                "value": msg_value
-            })
+            state['vote_count'][msg_value] += 1
+            if 'receive' in active:
+                logger.log_event({
+                    "type": "receive_vote",
+                    "pid": process.pid,
+                    "round": r,
+                    "from": sender,
+                    "value": msg_value
+                })
         elif msg_type == 'decide':
-            state['decisions'].append(msg_value)
-            logger.log_event({
-                "type": "receive_decision",
-                "pid": process.pid,
-                "round": r,
-                "from": sender,
-                "value": msg_value
-            })
+            state['decision_count'][DECISION_SLOT[msg_value]] += 1
+            if msg_value != '?' and state['first_decision'] is None:
+                state['first_decision'] = msg_value
+            if 'receive' in active:
+                logger.log_event({
+                    "type": "receive_decision",
+                    "pid": process.pid,
+                    "round": r,
+                    "from": sender,
+                    "value": msg_value
+                })
     
     else: # Receive no message : no change
         return round_advanced
     
     # 2. decide value when votes are sufficient
-    if len(state['votes']) >= n-t:
-        majority = majority_value(n, state['votes'])
-        decision = majority if majority is not None else '?'
-        decision_msg = (process.pid, 'decide', r, decision)
-                      
-        for target in config.processes:
-            if target != process.pid:
-                config.message_system.send(target, decision_msg)
-                logger.log_event({
-                    "type": "send_decision",
-                    "from": process.pid,
-                    "to": target,
-                    "round": r,
-                    "value": process.x
-                })
-        state['votes'].clear()
-        return round_advanced
+    vote_count = state['vote_count']
+    if vote_count[0] + vote_count[1] >= n-t:
+        send_decision(config, process, r, n, vote_count, logger, active)
     
-    # 3. if receive more than N - t 'decide' messages, 
-    if len(state['decisions']) >= n - t:
-        counts = {}
-        for val in state['decisions']:
-            if val != '?':
-                counts[val] = counts.get(val, 0) + 1
+    # 3. if receive more than N - t 'decide' messages, once this process's own round-r
+    # decide is out: deciding or moving on earlier would drop the votes it still needs
+    # to send it (close/advance_floor), and peers counting on that decide would stall
+    decision_count = state['decision_count']
+    if state['decide_sent'] == r and decision_count[0] + decision_count[1] + decision_count[2] >= n - t:
+        first = state['first_decision']
+        seen = () if first is None else (first, 1 - first) #values in arrival order
             
         # There exists more than t D-messages with same value
-        for v, cnt in counts.items():
-            if cnt >= t + 1:
+        for v in seen:
+            if decision_count[v] >= t + 1:
                 process.y = v
-                logger.log_event({
-                "type": "decide_final",
-                "pid": process.pid,
-                "round": r,
-                "value": v
-                })
+                if 'decision' in active:
+                    logger.log_event({
+                        "type": "decide_final",
+                        "pid": process.pid,
+                        "round": r,
+                        "value": v
+                    })
+                # every undecided process saw at least one decide(v) this round, so round
+                # r+1 is all votes and decides for v. Sending its own up front lets this
+                # process go quiescent now without leaving the others short of n-t
+                peers = [target for target in config.processes if target != process.pid]
+                for kind, event_type in (('vote', "send_vote"), ('decide', "send_decision")):
+                    config.message_system.broadcast(peers, (process.pid, kind, r + 1, v))
+                    if 'send' in active:
+                        logger.log_event({
+                            "type": event_type,
+                            "from": process.pid,
+                            "to": "*",
+                            "round": r + 1,
+                            "value": v
+                        })
+                # quiescent from now on: no buffered rounds, no queued or future messages
+                state['future'].clear()
+                config.message_system.close(process.pid)
                 return round_advanced
 
         #There exists at least one D-message    
-        if counts: 
-            chosen = next(iter(counts))
+        if first is not None: 
+            chosen = first
             process.x = chosen
-            logger.log_event({
-                "type": "update_x_from_D",
-                "pid": process.pid,
-                "round": r,
-                "new_x": chosen
-            })
+            if 'round' in active:
+                logger.log_event({
+                    "type": "update_x_from_D",
+                    "pid": process.pid,
+                    "round": r,
+                    "new_x": chosen
+                })
             
         else:
-            rand_val = random.choice([0,1])
+            rand_val = config.rng.choice([0,1])
             process.x = rand_val
-            logger.log_event({
-                "type": "random_x_choice",
-                "pid": process.pid,
-                "round": r,
-                "new_x": rand_val
-            })
+            if 'round' in active:
+                logger.log_event({
+                    "type": "random_x_choice",
+                    "pid": process.pid,
+                    "round": r,
+                    "new_x": rand_val
+                })
         
-        state['decisions'].clear()
+        decision_count[0] = decision_count[1] = decision_count[2] = 0
+        vote_count[0] = vote_count[1] = 0 #late votes of the old round must not count in the new one
+        state['first_decision'] = None
         state['round'] += 1
         round_advanced = True
 
         new_r = state['round']
+        config.message_system.advance_floor(process.pid, new_r)
         
-        logger.log_event({
-            "type": "advance_round",
-            "pid": process.pid,
-            "new_round": new_r
-        })
-            
-        for target in  config.processes:
-            if target != process.pid:
-                msg = (process.pid, 'vote', new_r, process.x)
-                config.message_system.send(target, msg)
-                logger.log_event({
-                    "type": "send_vote",
-                    "from": process.pid,
-                    "to": target,
-                    "round": new_r,
-                    "value": process.x
-                })
+        if 'round' in active:
+            logger.log_event({
+                "type": "advance_round",
+                "pid": process.pid,
+                "new_round": new_r
+            })
+        
+        vote_msg = (process.pid, 'vote', new_r, process.x)
+        config.message_system.broadcast([target for target in config.processes if target != process.pid], vote_msg)
+        if 'send' in active:
+            logger.log_event({
+                "type": "send_vote",
+                "from": process.pid,
+                "to": "*",
+                "round": new_r,
+                "value": process.x
+            })
     
         return round_advanced
     else:
         return round_advanced
     
 
-def inject_future_messages(config, pid, logger=None):
+def inject_future_messages(config, pid, logger=None, handler_args=None):
+    # replay the messages stored for pid's new round. A replayed batch can advance the
+    # round again, so this drains round after round until the current one has nothing
+    # stored. The handler is called directly: no Event per message, no recursion
     process = config.processes[pid]
     state = process.state
-    current_r = state['round']
+    future = state.get('future')
+    if not future:
+        return
+    active = logger.active if logger is not None else ()
+    applied = 0
+    before = config.monitor.watch(process)
     
-    if current_r in state.get('future', {}):
-        messages = state['future'].pop(current_r)
-        logger.log_event({
-            "type": "inject_future_messages",
-            "pid": pid,
-            "round": current_r,
-            "count": len(messages)
-        })
+    while future:
+        current_r = state['round']
+        pending = future.pop(current_r, None)
+        if pending is None:
+            break
+        messages = pending['messages']
+        if 'buffer' in active:
+            logger.log_event({
+                "type": "inject_future_messages",
+                "pid": pid,
+                "round": current_r,
+                "count": len(messages)
+            })
         for msg in messages:
-            event = Event(pid, msg)
-            event.apply(config, handler=ben_or_handler, logger=logger)
\ No newline at end of file
+            if 'receive' in active:
+                logger.log_event({
+                    "type": "receive",
+                    "pid": pid,
+                    "message": msg
+                })
+            applied += 1
+            # a round advance leaves the rest of the batch in an old round, and a decision
+            # clears the future buffer: either way this batch is done
+            if ben_or_handler(config, process, msg, handler_args=handler_args, logger=logger) or process.y in (0, 1):
+                break
+                
+    # same bookkeeping Event.apply does per delivery
+    if applied:
+        config.monitor.observe(process, before)
+        config.mark_dirty(pid)
+        config.round += applied
+        config.id = f"C{config.round}"
@@ -0,0 +1,176 @@
+# protocols/ben_or_vectorized.py
+#
+# Many independent Ben-Or instances held as NumPy arrays and stepped in lock-step,
+# one protocol round per step. Thresholds follow ben_or_handler:
+#   - a process tallies the first n-t votes it receives (others only, like the broadcasts)
+#     and sends decide(v) if more than n//2 of them are v, decide('?') otherwise
+#   - on the first n-t decide messages it decides v if v appears at least t+1 times,
+#     else adopts any non-'?' value, else flips a coin
+#   - a process that decides v in round r sends vote(v) and decide(v) for round r+1
+#     without waiting for that round's messages, then stops, like the reference
+#     (every undecided process adopted v in round r, so round r+1 is unanimous)
+# Message arrival order stands in for the random scheduler of simulate_ben_or: queues
+# are FIFO and every broadcast reaches all of them at once, so each phase uses one
+# order of the senders per instance, pid order for the initial votes and a fresh
+# uniform permutation after that.
+
+from collections import Counter
+
+import numpy as np
+
+UNDECIDED = -1
+UNKNOWN = 2 #the '?' decide value
+
+def _pick_senders(rng, sending, receiving, k, in_pid_order=False):
+    # (B, n, k) indices of the first k senders each receiver hears from, plus a
+    # (B,) mask of instances where a receiver has fewer than k other processes sending.
+    # A broadcast lands in every queue at once and queues are FIFO, so all receivers of
+    # an instance hear the senders in one common order (minus themselves)
+    B, n = sending.shape
+    if in_pid_order:
+        keys = np.broadcast_to(np.arange(n, dtype=float), (B, n, n)).copy()
+    else:
+        keys = np.repeat(rng.random((B, 1, n)), n, axis=1)
+    keys[~np.broadcast_to(sending[:, None, :], keys.shape)] = np.inf
+    keys[:, np.arange(n), np.arange(n)] = np.inf #no message to self
+    order = np.argsort(keys, axis=2)[:, :, :k]
+    starved = np.isinf(np.take_along_axis(keys, order[:, :, k - 1:k], axis=2))[:, :, 0]
+    stalled = (starved & receiving).any(axis=1)
+    return order, stalled
+
+def _step(rng, n, t, x, y, rnd, active, lingering, stalled, decided_round, first_round=False):
+    # lingering: processes that decided last round and send their final vote and decide now
+    k = n - t
+    live = ~stalled & active.any(axis=1)
+    if not live.any():
+        return False
+    idx = np.flatnonzero(live)
+    xa, act, ling = x[idx], active[idx], lingering[idx]
+    sending = act | ling
+
+    # 1. vote phase
+    # round 1 votes are the initial broadcasts, sent in pid order
+    senders, stalled_votes = _pick_senders(rng, sending, act, k, in_pid_order=first_round)
+    votes = np.take_along_axis(np.broadcast_to(xa[:, None, :], senders.shape[:2] + (n,)), senders, axis=2)
+    ones = (votes == 1).sum(axis=2)
+    zeros = k - ones
+    d = np.full(ones.shape, UNKNOWN, dtype=np.int8)
+    d[zeros > n // 2] = 0
+    d[ones > n // 2] = 1
+    d[ling] = xa[ling] #a lingering process decides its value without tallying
+
+    # 2. decision phase
+    senders, stalled_decisions = _pick_senders(rng, sending, act, k)
+    dvals = np.take_along_axis(np.broadcast_to(d[:, None, :], senders.shape[:2] + (n,)), senders, axis=2)
+    c0 = (dvals == 0).sum(axis=2)
+    c1 = (dvals == 1).sum(axis=2)
+
+    # non-'?' decide values of one round always agree, so the seen value is unique
+    seen = np.where(c1 > 0, 1, np.where(c0 > 0, 0, UNDECIDED))
+    count = np.maximum(c0, c1)
+    stuck = stalled_votes | stalled_decisions
+    moving = act & ~stuck[:, None]
+
+    decide = moving & (seen != UNDECIDED) & (count >= t + 1)
+    adopt = moving & (seen != UNDECIDED) & ~decide
+    coin = moving & (seen == UNDECIDED)
+
+    xa = xa.copy()
+    xa[adopt | decide] = seen[adopt | decide]
+    flips = rng.integers(0, 2, size=xa.shape, dtype=np.int8)
+    xa[coin] = flips[coin]
+
+    ya = y[idx]
+    ya[decide] = seen[decide]
+    advance = moving & ~decide
+    ra = rnd[idx]
+    dr = decided_round[idx]
+    dr[decide] = ra[decide]
+    ra[advance] += 1
+
+    x[idx], y[idx], rnd[idx], decided_round[idx] = xa, ya, ra, dr
+    active[idx] = act & ~decide
+    lingering[idx] = decide
+    stalled[idx] = stuck
+    return True
+
+def simulate_ben_or_vectorized(instances, n=3, t=1, max_rounds=100, seed=None, inputs=None):
+    # run `instances` independent executions; inputs is None (random, as in simulate_ben_or),
+    # a length-n vector shared by every instance, or an (instances, n) array
+    if not(0 <= t and n > 2*t):
+        raise ValueError(f"Invalid parameters : Ben-Or requires n > 2t and t ≥ 0. Got n={n}, t={t}")
+    rng = np.random.default_rng(seed)
+
+    if inputs is None:
+        x = rng.integers(0, 2, size=(instances, n), dtype=np.int8)
+    else:
+        x = np.array(np.broadcast_to(np.asarray(inputs, dtype=np.int8), (instances, n)))
+    initial = x.copy()
+    y = np.full((instances, n), UNDECIDED, dtype=np.int8)
+    rnd = np.ones((instances, n), dtype=np.int32)
+    decided_round = np.full((instances, n), UNDECIDED, dtype=np.int32)
+    active = np.ones((instances, n), dtype=bool)
+    lingering = np.zeros((instances, n), dtype=bool)
+    stalled = np.zeros(instances, dtype=bool)
+
+    for step in range(max_rounds):
+        if not _step(rng, n, t, x, y, rnd, active, lingering, stalled, decided_round, first_round=step == 0):
+            break
+
+    decided_any0 = (y == 0).any(axis=1)
+    decided_any1 = (y == 1).any(axis=1)
+    return {
+        'inputs': initial,
+        'x': x,
+        'y': y,
+        'round': rnd,
+        'decided_round': decided_round,
+        'decided': (y != UNDECIDED).all(axis=1),
+        'stalled': stalled,
+        'rounds': rnd.max(axis=1),
+        'agreement_violation': decided_any0 & decided_any1
+    }
+
+def summarize(result):
+    # same shape as utils.batch.aggregate_results, minus the step counts a lock-step engine has no notion of
+    decided = result['decided']
+    violations = result['agreement_violation']
+    return {
+        'runs': int(decided.size),
+        'decided': int(decided.sum()),
+        'undecided': int((~decided).sum()),
+        'stalled': int(result['stalled'].sum()),
+        'agreement_violations': int(violations.sum()),
+        'rounds_to_decision': Counter(result['rounds'][decided].tolist()),
+        'violating_seeds': np.flatnonzero(violations).tolist()
+    }
+
+def run_vectorized_batch(instances, n=3, t=1, max_rounds=100, seed=None, batch_size=100000):
+    # chunked driver for very large instance counts; memory per chunk is O(batch_size * n^2)
+    rng = np.random.default_rng(seed)
+    total = None
+    done = 0
+    while done < instances:
+        size = min(batch_size, instances - done)
+        summary = summarize(simulate_ben_or_vectorized(size, n, t, max_rounds, seed=rng.integers(2**63)))
+        summary['violating_seeds'] = [done + i for i in summary['violating_seeds']]
+        if total is None:
+            total = summary
+        else:
+            for key in ('runs', 'decided', 'undecided', 'stalled', 'agreement_violations'):
+                total[key] += summary[key]
+            total['rounds_to_decision'] += summary['rounds_to_decision']
+            total['violating_seeds'] += summary['violating_seeds']
+        done += size
+    return total
+
+def compare_with_reference(runs=1000, n=3, t=1, rounds=300, seed=0):
+    # decided fraction and rounds-to-decision of both engines side by side, for small n
+    from utils.batch import run_batch
+
+    reference = run_batch(range(seed, seed + runs), n=n, t=t, rounds=rounds, workers=1)
+    vectorized = summarize(simulate_ben_or_vectorized(runs, n, t, seed=seed))
+    return {
+        'reference': {key: reference[key] for key in ('runs', 'decided', 'undecided', 'agreement_violations', 'rounds_to_decision')},
+        'vectorized': {key: vectorized[key] for key in ('runs', 'decided', 'undecided', 'agreement_violations', 'rounds_to_decision')}
+    }
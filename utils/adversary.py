@@ -0,0 +1,206 @@
+# utils/adversary.py
+#
+# Adversarial schedules: instead of picking the next delivery at random, search for the
+# delivery orders that keep every process undecided for as long as possible.
+# A search node is a forked Configuration. Its children are the configurations reached
+# by delivering one distinct pending message (an FLP event (p, m)). Nodes are keyed by
+# Configuration.fingerprint(), so a configuration reached through several schedules is
+# expanded once. The search is a beam search: each depth keeps the beam_width children
+# that look furthest from a decision (see pressure()).
+# Schedules are traces of (receiver, index) pairs, index being the position of the
+# delivered message in the receiver's queue at that step. Coin flips are not part of a
+# trace: they come from the run's seeded rng, so replaying a trace on the same seed
+# (TraceScheduler, replay_trace) reproduces the run exactly.
+
+import heapq
+import json
+import time
+
+from base.event import Event
+from main import build_ben_or, simulate_ben_or
+from protocols.ben_or import ben_or_handler, inject_future_messages
+from utils.schedule import Scheduler
+
+def pressure(config):
+    # how close config is to a decision: decide(v) messages already counted by undecided
+    # processes plus those still in flight. '?' decide messages do not count
+    total = 0
+    for p in config.processes.values():
+        state = p.peek_state()
+        if p.y == 'b' and 'decision_count' in state:
+            total += max(state['decision_count'][0], state['decision_count'][1])
+    for queue in config.message_system.peek_buffer().values():
+        for message in queue:
+            if message[1] == 'decide' and message[3] != '?':
+                total += 1
+    return total
+
+def score(config):
+    # higher is better for the adversary: low pressure, then processes lagging behind
+    rounds = [p.peek_state().get('round', 1) for p in config.processes.values()]
+    return -pressure(config), -(max(rounds) - min(rounds))
+
+def enabled_deliveries(config):
+    # (receiver, index) of the first copy of every distinct pending message of a live process
+    deliveries = []
+    for receiver, queue in config.message_system.peek_buffer().items():
+        if not queue or not config.processes[receiver].alive:
+            continue
+        seen = set()
+        for index, message in enumerate(queue):
+            if message not in seen:
+                seen.add(message)
+                deliveries.append((receiver, index))
+    return deliveries
+
+def deliver(config, handler_args, receiver, index, logger=None):
+    # one step of run_steps with a chosen delivery (index None: step without a message)
+    message = config.message_system.take(receiver, index) if index is not None else None
+    round_advanced = Event(receiver, message).apply(config, handler=ben_or_handler, handler_args=handler_args, logger=logger)
+    if round_advanced:
+        inject_future_messages(config, receiver, logger, handler_args)
+    config.dirty.clear()
+
+def _unwind(node):
+    # traces are stored as linked (parent, step) pairs so extending one is O(1)
+    trace = []
+    while node is not None:
+        node, step = node
+        trace.append(step)
+    trace.reverse()
+    return trace
+
+def beam_search(config, handler_args, beam_width=64, max_depth=200, top_k=5, seen=None):
+    # the top_k schedules that delay the first decision the longest, starting from config.
+    # Each result: {'trace', 'steps', 'decided', 'deadlocked', 'decision_values', 'config'}.
+    # Deadlocks (nothing left to deliver, nobody decided) rank first, then schedules still
+    # undecided after max_depth steps, then decided ones by length
+    seen = set() if seen is None else seen
+    seen.add(config.fingerprint())
+    beam = [(score(config), 0, config, None)]
+    finished = [] #(steps, order, trace node, config) of schedules that decided or deadlocked
+    order = 1 #tie-breaker so heap entries never compare configurations
+    expansions = 0
+    start = time.perf_counter()
+
+    for depth in range(max_depth):
+        candidates = []
+        for _, _, current, node in beam:
+            deliveries = enabled_deliveries(current)
+            if not deliveries:
+                finished.append((depth, order, node, current))
+                order += 1
+                continue
+            for receiver, index in deliveries:
+                child = current.fork()
+                deliver(child, handler_args, receiver, index)
+                expansions += 1
+                key = child.fingerprint()
+                if key in seen:
+                    continue
+                seen.add(key)
+                child_node = (node, (receiver, index))
+                if child.decision_values():
+                    finished.append((depth + 1, order, child_node, child))
+                else:
+                    candidates.append((score(child), order, child, child_node))
+                order += 1
+        if not candidates:
+            beam = []
+            break
+        beam = heapq.nlargest(beam_width, candidates, key=lambda c: (c[0], -c[1]))
+
+    elapsed = time.perf_counter() - start
+    survivors = [(max_depth, o, node, c) for _, o, c, node in beam]
+    deadlocked = [f for f in finished if not f[3].decision_values()]
+    decided = [f for f in finished if f[3].decision_values()]
+    ranked = (sorted(deadlocked, key=lambda f: f[1]) + sorted(survivors, key=lambda s: s[1])
+              + sorted(decided, key=lambda f: (-f[0], f[1])))
+    results = []
+    for steps, _, node, final in ranked[:top_k]:
+        results.append({
+            'trace': _unwind(node),
+            'steps': steps,
+            'decided': bool(final.decision_values()),
+            'deadlocked': not final.decision_values() and not enabled_deliveries(final),
+            'decision_values': sorted(final.decision_values()),
+            'config': final
+        })
+    return {
+        'schedules': results,
+        'expansions': expansions,
+        'distinct': len(seen),
+        'seconds': elapsed,
+        'expansions_per_second': expansions / elapsed if elapsed else 0.0
+    }
+
+def search_worst_schedules(n=3, t=1, seed=None, beam_width=64, max_depth=200, top_k=5):
+    # beam search from the initial configuration simulate_ben_or(seed=seed) starts from
+    config, handler_args = build_ben_or(n, t, seed)
+    result = beam_search(config, handler_args, beam_width, max_depth, top_k)
+    for schedule in result['schedules']:
+        schedule.update({'n': n, 't': t, 'seed': seed})
+    return result
+
+def save_trace(path, schedule):
+    # JSON record of one schedule, enough for replay_trace
+    record = {key: schedule[key] for key in ('n', 't', 'seed', 'steps', 'decided', 'deadlocked', 'decision_values')}
+    record['trace'] = [list(step) for step in schedule['trace']]
+    with open(path, "w") as f:
+        json.dump(record, f)
+
+def load_trace(path):
+    with open(path) as f:
+        record = json.load(f)
+    record['trace'] = [tuple(step) for step in record['trace']]
+    return record
+
+class TraceScheduler(Scheduler):
+    # replays a recorded schedule step by step, then stops the run
+    def __init__(self, trace):
+        self.trace = trace
+        self.position = 0
+
+    def next_event(self, config):
+        if self.position >= len(self.trace):
+            return None
+        step = self.trace[self.position]
+        self.position += 1
+        return step
+
+class AdversarialScheduler(Scheduler):
+    # online adversary for simulate_ben_or: before every delivery, a short beam search
+    # from the current configuration picks the first step of the worst schedule found
+    def __init__(self, handler_args, horizon=6, beam_width=16):
+        self.handler_args = handler_args
+        self.horizon = horizon
+        self.beam_width = beam_width
+        self.trace = [] #deliveries chosen so far, replayable with TraceScheduler
+
+    def next_event(self, config):
+        result = beam_search(config.fork(), self.handler_args, self.beam_width, self.horizon, top_k=1)
+        schedules = result['schedules']
+        if not schedules or not schedules[0]['trace']:
+            # nothing new reachable: fall back to any pending delivery
+            deliveries = enabled_deliveries(config)
+            if not deliveries:
+                return None
+            step = deliveries[0]
+        else:
+            step = schedules[0]['trace'][0]
+        self.trace.append(step)
+        return step
+
+def replay_trace(record, log_enabled=True, log_path="simulation_log.json"):
+    # rerun a saved schedule (record from load_trace or search_worst_schedules) through simulate_ben_or
+    trace = record['trace']
+    return simulate_ben_or(n=record['n'], t=record['t'], rounds=len(trace), seed=record['seed'],
+                           log_enabled=log_enabled, log_path=log_path, scheduler=TraceScheduler(trace))
+
+if __name__ == "__main__":
+    result = search_worst_schedules(seed=0)
+    print(f"{result['expansions']} expansions, {result['distinct']} distinct configurations, "
+          f"{result['expansions_per_second']:.0f} expansions/s")
+    for schedule in result['schedules']:
+        status = "deadlocked" if schedule['deadlocked'] else "decided" if schedule['decided'] else "undecided"
+        print(schedule['steps'], "steps", status, schedule['decision_values'])
@@ -0,0 +1,59 @@
+# utils/batch.py
+
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+import os
+
+from main import simulate_ben_or
+
+def _run_seed(args):
+    # top-level so it can be pickled into worker processes
+    seed, n, t, rounds, scheduler = args
+    # scheduler is a factory (e.g. a class from utils/schedule.py): schedulers hold per-run state
+    return simulate_ben_or(n=n, t=t, rounds=rounds, seed=seed, log_enabled=False, log_path=None,
+                           scheduler=scheduler() if scheduler is not None else None)
+
+def aggregate_results(results):
+    summary = {
+        'runs': 0,
+        'decided': 0,
+        'undecided': 0,
+        'agreement_violations': 0,
+        'rounds_to_decision': Counter(),
+        'steps_to_decision': Counter(),
+        'violating_seeds': []
+    }
+    for result in results:
+        summary['runs'] += 1
+        if result['agreement_violation']:
+            summary['agreement_violations'] += 1
+            summary['violating_seeds'].append(result['seed'])
+        if result['decided']:
+            summary['decided'] += 1
+            summary['rounds_to_decision'][result['rounds']] += 1
+            summary['steps_to_decision'][result['steps']] += 1
+        else:
+            summary['undecided'] += 1
+            
+    steps = summary['steps_to_decision']
+    summary['mean_steps_to_decision'] = (
+        sum(s * c for s, c in steps.items()) / summary['decided'] if summary['decided'] else None)
+    return summary
+
+def run_batch(seeds, n=3, t=1, rounds=300, workers=None, chunksize=None, scheduler=None):
+    # run one Ben-Or execution per seed across a process pool and aggregate the results
+    seeds = list(seeds)
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        # a few chunks per worker keeps the pool busy without paying per-seed IPC
+        chunksize = max(1, len(seeds) // (workers * 4))
+        
+    jobs = [(seed, n, t, rounds, scheduler) for seed in seeds]
+    if workers == 1:
+        return aggregate_results(map(_run_seed, jobs))
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return aggregate_results(pool.map(_run_seed, jobs, chunksize=chunksize))
+    
+if __name__=="__main__":
+    print(run_batch(range(1000), n=3, t=1, rounds=300))
@@ -0,0 +1,148 @@
+# utils/binlog.py
+
+import json
+import os
+import struct
+
+# fixed-width little-endian record: step, type id, pid id, peer id, round, value
+RECORD = struct.Struct('<IHHHib')
+RECORD_FIELDS = [('step', '<u4'), ('type', '<u2'), ('pid', '<u2'), ('peer', '<u2'), ('round', '<i4'), ('value', '<i1')]
+NO_ID = 0xFFFF #pid/peer not present in the entry
+BROADCAST = '*' #peer of a broadcast entry: every other process
+BROADCAST_ID = 0xFFFE
+NO_ROUND = -1
+VALUE_CODES = {0: 0, 1: 1, '?': 2, 'b': 3} #anything else (None included) is stored as -1
+VALUE_NAMES = {code: value for value, code in VALUE_CODES.items()}
+
+def meta_path(path):
+    return path + ".meta.json"
+
+def _entry_fields(entry):
+    # project a log entry onto (pid, peer, round, value); snapshots keep only step and type
+    message = entry.get('message')
+    if not isinstance(message, (list, tuple)) or len(message) != 4:
+        message = None
+        
+    pid = entry.get('pid', entry.get('receiver'))
+    peer = entry.get('to')
+    if pid is None:
+        pid = entry.get('from')
+    elif peer is None:
+        peer = entry.get('from', message[0] if message else None)
+        
+    rnd = NO_ROUND
+    for key in ('round', 'new_round', 'store_round'):
+        if isinstance(entry.get(key), int):
+            rnd = entry[key]
+            break
+    else:
+        if message:
+            rnd = message[2]
+            
+    value = entry.get('value', entry.get('new_x', message[3] if message else None))
+    return pid, peer, rnd, VALUE_CODES.get(value, -1)
+
+class BinaryLogWriter:
+    # append-only SimulationLogger sink; the intern tables go to a JSON sidecar on close
+    def __init__(self, path, buffer_size=1 << 16):
+        self.path = path
+        self.file = open(path, "wb", buffering=buffer_size)
+        self.types = {}
+        self.pids = {}
+        
+    def _intern(self, table, key):
+        if key is None:
+            return NO_ID
+        if key == BROADCAST:
+            return BROADCAST_ID
+        code = table.get(key)
+        if code is None:
+            code = table[key] = len(table)
+        return code
+        
+    def write(self, entry):
+        pid, peer, rnd, value = _entry_fields(entry)
+        self.file.write(RECORD.pack(
+            entry['step'],
+            self._intern(self.types, entry['type']),
+            self._intern(self.pids, pid),
+            self._intern(self.pids, peer),
+            rnd,
+            value))
+        
+    def close(self):
+        self.file.close()
+        with open(meta_path(self.path), "w", encoding="utf-8") as f:
+            json.dump({
+                'record_size': RECORD.size,
+                'fields': [name for name, _ in RECORD_FIELDS],
+                'types': list(self.types),
+                'pids': list(self.pids)
+            }, f)
+
+class BinaryLogReader:
+    # columnar view over a binary log; columns are memory-mapped NumPy arrays
+    def __init__(self, path):
+        import numpy as np
+        
+        self.np = np
+        self.path = path
+        with open(meta_path(path), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.types = meta['types']
+        self.pids = meta['pids']
+        self._type_ids = {name: i for i, name in enumerate(self.types)}
+        self._pid_ids = {pid: i for i, pid in enumerate(self.pids)}
+        
+        dtype = np.dtype(RECORD_FIELDS)
+        count = os.path.getsize(path) // dtype.itemsize #a torn trailing record is ignored
+        if count:
+            self.records = np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+            
+    def __len__(self):
+        return len(self.records)
+    
+    def __getitem__(self, field):
+        return self.records[field]
+    
+    def column(self, field):
+        return self.records[field]
+    
+    def type_id(self, name):
+        return self._type_ids.get(name, NO_ID)
+    
+    def pid_id(self, pid):
+        if pid == BROADCAST:
+            return BROADCAST_ID
+        return self._pid_ids.get(pid, NO_ID)
+    
+    def where(self, type=None, pid=None, peer=None, round=None):
+        # boolean mask over records matching every given filter
+        mask = self.np.ones(len(self.records), dtype=bool)
+        if type is not None:
+            mask &= self.records['type'] == self.type_id(type)
+        if pid is not None:
+            mask &= self.records['pid'] == self.pid_id(pid)
+        if peer is not None:
+            mask &= self.records['peer'] == self.pid_id(peer)
+        if round is not None:
+            mask &= self.records['round'] == round
+        return mask
+    
+    def decode(self, index):
+        # one record back as a (sparse) log entry
+        record = self.records[index]
+        entry = {'step': int(record['step']), 'type': self.types[record['type']]}
+        if record['pid'] != NO_ID:
+            entry['pid'] = self.pids[record['pid']]
+        if record['peer'] == BROADCAST_ID:
+            entry['peer'] = BROADCAST
+        elif record['peer'] != NO_ID:
+            entry['peer'] = self.pids[record['peer']]
+        if record['round'] != NO_ROUND:
+            entry['round'] = int(record['round'])
+        if record['value'] in VALUE_NAMES:
+            entry['value'] = VALUE_NAMES[int(record['value'])]
+        return entry
@@ -0,0 +1,294 @@
+# utils/explorer.py
+#
+# Exhaustive exploration of the configurations reachable from an initial Configuration.
+# A step is an FLP event (p, m): process p receives one of the messages buffered for it.
+# Coin flips inside the handler branch as well, so every reachable configuration is visited.
+# Configurations are keyed by Configuration.fingerprint(), so a configuration reached
+# through different schedules is expanded once.
+#
+# With reduction='sleep' the search also uses sleep sets (partial-order reduction).
+# Events of different processes commute and never disable each other (FLP Lemma 1), so
+# after exploring (p, m) the explorer puts it to sleep in the subtrees of its siblings
+# that belong to other processes, and a stored configuration is re-expanded only for
+# events that were asleep before. This prunes transitions, not configurations: with
+# state caching, sleep sets alone still store nearly every configuration reachable
+# within the bound. At n=4, inputs (0,1,1,0), max_round=1 the search keeps 51,278 of
+# 51,674 states while transitions drop from 320,772 to 151,417 and the run time
+# halves. It does not make a larger n feasible. The configurations it skipped in the
+# runs checked were all leaves, but that is observed, not proven. Labels of inner
+# configurations only count the reduced graph below them and can differ from the full
+# search's. Compare root valences with cross_check(), which runs both searches over
+# all 2^n inputs.
+# Persistent sets do not reduce further here: any process can still be sent new
+# messages, so no strict subset of the enabled events is persistent in general.
+# Collapsing a delivery that crosses no n-t or t+1 threshold is not sound either:
+# later deliveries to the same process depend on it, because they can cross that
+# threshold with a different set of messages counted.
+#
+# With symmetry=True configurations are keyed by their canonical form under the pid
+# permutations that keep inputs and liveness (Configuration.canonical_fingerprint), so
+# configurations that differ only by such a relabeling share one entry. Sleep sets are
+# stored in canonical pids and translated back for each concrete representative.
+
+from collections import defaultdict, deque
+from itertools import product
+
+from base.configuration import Configuration
+from base.event import Event
+from base.message_system import MessageSystem
+from base.process import Process
+from protocols.ben_or import ben_or_handler, inject_future_messages
+
+ZERO_VALENT = '0-valent'
+ONE_VALENT = '1-valent'
+BIVALENT = 'bivalent'
+UNDETERMINED = 'undetermined' #no decision reachable within the exploration bound
+
+def valence_label(values):
+    if values == {0, 1}:
+        return BIVALENT
+    if values == {0}:
+        return ZERO_VALENT
+    if values == {1}:
+        return ONE_VALENT
+    return UNDETERMINED
+
+class ForcedCoin:
+    # stands in for config.rng while expanding an event: every coin flip returns
+    # `value`, and `used` tells the explorer whether the other outcome must be tried too
+    def __init__(self, value):
+        self.value = value
+        self.used = False
+
+    def choice(self, seq):
+        self.used = True
+        return self.value
+
+def initial_configuration(inputs):
+    # Ben-Or processes P1..Pn with the given inputs and their round-1 votes in flight
+    processes = [Process(f'P{i+1}', input_value=x) for i, x in enumerate(inputs)]
+    message_system = MessageSystem()
+    config = Configuration(processes, message_system)
+    for p in processes:
+        for target in config.processes:
+            if target != p.pid:
+                message_system.send(target, (p.pid, 'vote', 1, p.x))
+    return config
+
+class StateSpaceExplorer:
+    def __init__(self, handler=ben_or_handler, handler_args=None, max_round=2, max_states=200000,
+                 on_round_advanced=inject_future_messages, reduction=None, symmetry=False):
+        # max_round: configurations where some process is past this round are not expanded
+        # max_states: hard cap on distinct configurations; the result reports whether it was hit
+        # reduction: None for the full search, 'sleep' for sleep-set partial-order reduction
+        # symmetry: store one canonical representative per class of relabeled configurations
+        if reduction not in (None, 'sleep'):
+            raise ValueError(f"Unknown reduction: {reduction}")
+        self.reduction = reduction
+        self.symmetry = symmetry
+        self.perms = None #pid permutations of the current root, set by explore()
+        self.handler = handler
+        self.handler_args = handler_args or {}
+        self.max_round = max_round
+        self.max_states = max_states
+        self.on_round_advanced = on_round_advanced
+
+    def canonical(self, config):
+        # (key, pid map into canonical labels); the map is None without symmetry reduction
+        if self.perms is None:
+            return config.fingerprint(), None
+        return config.canonical_fingerprint(self.perms)
+
+    def key(self, config):
+        return self.canonical(config)[0]
+
+    def enabled_events(self, config):
+        # one event per distinct buffered message of each live process
+        events = []
+        for receiver, queue in config.message_system.peek_buffer().items():
+            if queue and config.processes[receiver].alive:
+                events.extend((receiver, m) for m in dict.fromkeys(queue))
+        return events
+
+    def apply(self, config, event):
+        # every configuration reachable by applying event to config (two when a coin is flipped)
+        children = []
+        for value in (0, 1):
+            child = config.fork()
+            coin = ForcedCoin(value)
+            child.rng = coin
+            pid, message = event
+            queue = child.message_system.peek_buffer(pid)
+            child.message_system.take(pid, queue.index(message))
+            round_advanced = Event(pid, message).apply(child, self.handler, handler_args=self.handler_args)
+            if round_advanced and self.on_round_advanced is not None:
+                self.on_round_advanced(child, pid, None, self.handler_args)
+            child.dirty.clear()
+            children.append(child)
+            if not coin.used:
+                break
+        return children
+
+    def is_frontier(self, config):
+        # decided configurations and configurations past the round bound are leaves
+        if config.decision_values():
+            return True
+        return any(p.peek_state().get('round', 1) > self.max_round for p in config.processes.values())
+
+    def explore(self, config):
+        self.perms = config.pid_permutations() if self.symmetry else None
+        if self.reduction == 'sleep':
+            return self._explore_sleep(config)
+        root = self.key(config)
+        successors = {}
+        decisions = {}
+        truncated = 0
+        transitions = 0
+
+        queue = deque([(root, config)])
+        decisions[root] = frozenset(config.decision_values())
+        complete = True
+        while queue:
+            key, current = queue.popleft()
+            if self.is_frontier(current):
+                successors[key] = ()
+                truncated += not decisions[key]
+                continue
+            children = []
+            for event in self.enabled_events(current):
+                for child in self.apply(current, event):
+                    transitions += 1
+                    child_key = self.key(child)
+                    children.append(child_key)
+                    if child_key in decisions:
+                        continue
+                    if len(decisions) >= self.max_states:
+                        complete = False
+                        continue
+                    decisions[child_key] = frozenset(child.decision_values())
+                    queue.append((child_key, child))
+            successors[key] = children
+
+        values = propagate_valence(successors, decisions)
+        return {
+            'root': root,
+            'valence': valence_label(values[root]),
+            'labels': {key: valence_label(v) for key, v in values.items()},
+            'states': len(decisions),
+            'transitions': transitions,
+            'truncated': truncated,
+            'complete': complete
+        }
+
+    def _explore_sleep(self, config):
+        # state caching with sleep sets: a configuration is expanded again only if it is
+        # reached with a sleep set that does not cover the one it was stored with, and
+        # then only for the events that were asleep before but are awake now
+        root, root_map = self.canonical(config)
+        successors = defaultdict(list)
+        decisions = {root: frozenset(config.decision_values())}
+        sleeping = {root: frozenset()} #sleep set each configuration is stored with
+        expanded = defaultdict(list) #events already expanded at each configuration, in order
+        truncated = 0
+        transitions = 0
+        complete = True
+
+        queue = deque([(root, config, root_map)])
+        while queue:
+            key, current, pid_map = queue.popleft()
+            if self.is_frontier(current):
+                successors[key] = []
+                truncated += not decisions[key]
+                continue
+            inverse = None if pid_map is None else {v: k for k, v in pid_map.items()}
+            sleep = {_relabel_event(e, inverse) for e in sleeping[key]}
+            done = [_relabel_event(e, inverse) for e in expanded[key]]
+            for event in self.enabled_events(current):
+                if event in sleep or event in done:
+                    continue
+                # earlier siblings on other processes commute with event: no need to retry them below it
+                child_sleep = [e for e in sleep.union(done) if e[0] != event[0]]
+                done.append(event)
+                expanded[key].append(_relabel_event(event, pid_map))
+                for child in self.apply(current, event):
+                    transitions += 1
+                    child_key, child_map = self.canonical(child)
+                    successors[key].append(child_key)
+                    stored_sleep = frozenset(_relabel_event(e, child_map) for e in child_sleep)
+                    if child_key not in decisions:
+                        if len(decisions) >= self.max_states:
+                            complete = False
+                            continue
+                        decisions[child_key] = frozenset(child.decision_values())
+                        sleeping[child_key] = stored_sleep
+                        queue.append((child_key, child, child_map))
+                    elif not sleeping[child_key] <= stored_sleep:
+                        sleeping[child_key] = sleeping[child_key] & stored_sleep
+                        queue.append((child_key, child, child_map))
+
+        values = propagate_valence(successors, decisions)
+        return {
+            'root': root,
+            'valence': valence_label(values[root]),
+            'labels': {key: valence_label(v) for key, v in values.items()},
+            'states': len(decisions),
+            'transitions': transitions,
+            'truncated': truncated,
+            'complete': complete
+        }
+
+def _relabel_event(event, pid_map):
+    # rename the pids of an event (receiver and message sender) through pid_map
+    if pid_map is None:
+        return event
+    pid, message = event
+    return pid_map[pid], tuple(pid_map.get(f, f) if isinstance(f, str) else f for f in message)
+
+def propagate_valence(successors, decisions):
+    # decision values reachable from each configuration: own decisions plus those of every
+    # successor, pushed backwards over the explored graph until nothing changes
+    predecessors = defaultdict(list)
+    for key, children in successors.items():
+        for child in children:
+            predecessors[child].append(key)
+
+    values = {key: set(v) for key, v in decisions.items()}
+    work = deque(key for key, v in values.items() if v)
+    while work:
+        key = work.popleft()
+        for parent in predecessors[key]:
+            if not values[key] <= values[parent]:
+                values[parent] |= values[key]
+                work.append(parent)
+    return values
+
+def classify_inputs(n=3, t=1, max_round=2, max_states=200000, reduction=None, symmetry=False):
+    # valence of every initial configuration, the exhaustive version of
+    # message_based.consensus_protocol.bivalent_test_with_initial_messges
+    explorer = StateSpaceExplorer(handler_args={'n': n, 't': t}, max_round=max_round, max_states=max_states,
+                                  reduction=reduction, symmetry=symmetry)
+    return {inputs: explorer.explore(initial_configuration(inputs))['valence']
+            for inputs in product((0, 1), repeat=n)}
+
+def cross_check(n=3, t=1, max_round=2, max_states=200000, symmetry=False):
+    # root valence of every initial configuration under the full search and under sleep
+    # sets; returns {inputs: (full, reduced)} for the inputs where the two disagree
+    full = classify_inputs(n, t, max_round, max_states)
+    reduced = classify_inputs(n, t, max_round, max_states, reduction='sleep', symmetry=symmetry)
+    return {inputs: (full[inputs], reduced[inputs]) for inputs in full if full[inputs] != reduced[inputs]}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check sleep-set root valences against the full search.")
+    parser.add_argument("-n", type=int, default=3)
+    parser.add_argument("-t", type=int, default=1)
+    parser.add_argument("--max-round", type=int, default=2)
+    parser.add_argument("--max-states", type=int, default=200000)
+    parser.add_argument("--symmetry", action="store_true", help="reduced search also merges relabeled configurations")
+    args = parser.parse_args()
+
+    mismatches = cross_check(args.n, args.t, args.max_round, args.max_states, args.symmetry)
+    for inputs, (full, reduced) in mismatches.items():
+        print(f"{inputs}: full {full}, sleep {reduced}")
+    print(f"{2 ** args.n - len(mismatches)}/{2 ** args.n} inputs agree")
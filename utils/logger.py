@@ -1,49 +1,222 @@
 # utils/logger.py
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Deque, Iterator, Optional, Union
+from collections import deque
 import json
 
+# log categories; call sites check `category in logger.active` before building an entry
+LOG_CATEGORIES = frozenset([
+    'send',      # per-target send_* events in broadcast loops
+    'delivery',  # scheduler delivery attempts
+    'receive',   # message receipt by a process
+    'buffer',    # old/future message handling
+    'round',     # round advances and x updates
+    'decision',  # final decisions
+    'snapshot',  # configuration snapshots
+    'misc'       # anything not listed in EVENT_CATEGORIES
+])
+
+EVENT_CATEGORIES = {
+    'send_initial_broadcast': 'send',
+    'send_decision': 'send',
+    'send_vote': 'send',
+    'delivery_attemp': 'delivery',
+    'receive': 'receive',
+    'skipped': 'receive',
+    'receive_vote': 'receive',
+    'receive_decision': 'receive',
+    'ignore_old_message': 'buffer',
+    'store_future_message': 'buffer',
+    'drop_future_message': 'buffer',
+    'inject_future_messages': 'buffer',
+    'advance_round': 'round',
+    'update_x_from_D': 'round',
+    'random_x_choice': 'round',
+    'decide_final': 'decision',
+    'already_decided': 'decision',
+    'invariant_violation': 'decision'
+}
+
+class JsonlSink:
+    # newline-delimited compact JSON written through a buffered file handle
+    def __init__(self, path: str, buffer_size: int = 1 << 16):
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8", buffering=buffer_size)
+        
+    def write(self, entry: Dict[str, Any]):
+        self.file.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False))
+        self.file.write("\n")
+        
+    def close(self):
+        self.file.close()
+
 class SimulationLogger:
-    def __init__(self, enabled: bool = True):
+    def __init__(self, enabled: bool = True, keyframe_interval: int = 100,
+                 sink=None, keep_last: Optional[int] = None, categories=None):
+        # sink: a path (streamed as JSONL) or any object with write(entry)/close()
+        # keep_last: with a sink, keep only the last N entries in memory for post-mortems
+        # categories: subset of LOG_CATEGORIES to record, all of them by default
+        self.categories = LOG_CATEGORIES if categories is None else frozenset(categories)
+        unknown = self.categories - LOG_CATEGORIES
+        if unknown:
+            raise ValueError(f"Unknown log categories: {sorted(unknown)}")
         self.enabled = enabled
-        self.entries: List[Dict[str, Any]] = []
+        self.sink = JsonlSink(sink) if isinstance(sink, str) else sink
+        self.entries: Union[List[Dict[str, Any]], Deque[Dict[str, Any]]]
+        if keep_last is not None:
+            self.entries = deque(maxlen=keep_last)
+        elif self.sink is not None:
+            self.entries = deque(maxlen=0)
+        else:
+            self.entries = []
         self.step_counter = 0
+        self.keyframe_interval = keyframe_interval
+        self.snapshot_counter = 0
+        
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+    
+    @enabled.setter
+    def enabled(self, value: bool):
+        # active is empty while disabled, so every guarded call site short-circuits
+        self._enabled = value
+        self.active = self.categories if value else frozenset()
+        
+    def wants(self, category: str) -> bool:
+        return category in self.active
+        
+    def _emit(self, entry: Dict[str, Any]):
+        self.entries.append(entry)
+        if self.sink is not None:
+            self.sink.write(entry)
         
     def log_event(self, event: Dict[str, Any]):
-        if self.enabled:
+        if EVENT_CATEGORIES.get(event.get("type"), 'misc') in self.active:
             self.step_counter += 1
             entry = {
                 "step": self.step_counter,
                 **event
             }
-            self.entries.append(entry)
+            self._emit(entry)
             
     def snapshot(self, config_snapshot: Dict[str, Any]):
-        if self.enabled:
-            self.entries.append({
+        if 'snapshot' in self.active:
+            self._emit({
                 "step": self.step_counter,
                 "type": "snapshot",
                 "state": config_snapshot
             })
             
+    def snapshot_config(self, config):
+        # full keyframe every keyframe_interval snapshots, otherwise only the processes that changed
+        if 'snapshot' not in self.active:
+            return
+        dirty = config.pop_dirty()
+        if self.snapshot_counter % self.keyframe_interval == 0:
+            entry_type, state = "snapshot", config.get_state_summary()
+        else:
+            entry_type, state = "snapshot_delta", config.get_state_summary(dirty)
+        self.snapshot_counter += 1
+        self._emit({
+            "step": self.step_counter,
+            "type": entry_type,
+            "state": state
+        })
+            
     def final(self, message: str = None):
         if self.enabled:
-            self.entries.append({
+            self._emit({
                 "step": self.step_counter + 1,
                 "type": "final",
                 "message": message or "Simulation finished"
             })
             
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+            
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+            
     def export_as_dict(self) -> List[Dict[str, Any]]:
-        return self.entries
+        # with a sink this is only the retained tail of the run
+        return list(self.entries)
     
     def export_as_json(self, path: str = "simulation_log.json"):
         with open(path, "w", encoding="utf-8") as f:
-            json.dump(self.entries, f, indent=2, ensure_ascii=False)
+            json.dump(list(self.entries), f, indent=2, ensure_ascii=False)
             
     def print_log(self):
         if not self.enabled:
             print("Logging is disabled.")
             return
         for entry in self.entries:
-            print(json.dumps(entry, indent=2, ensure_ascii=False))
\ No newline at end of file
+            print(json.dumps(entry, indent=2, ensure_ascii=False))
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    # stream entries back from a JSONL log without loading the whole file
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def read_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    # stream entries back from a JSON-array log (export_as_json) without loading the whole file
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(chunk_size).lstrip()
+        if not buf.startswith("["):
+            raise ValueError(f"{path} is not a JSON array log")
+        pos = 1
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                entry, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # entry cut by the chunk boundary: keep only the unread tail and read on
+                more = f.read(chunk_size)
+                if not more:
+                    if buf[pos:].strip():
+                        raise
+                    return
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield entry
+            pos = end
+
+def read_log(path: str) -> Iterator[Dict[str, Any]]:
+    # entries of a .jsonl or .json log, streamed either way
+    if path.endswith(".jsonl"):
+        return read_jsonl(path)
+    return read_json_array(path)
+
+def rebuild_snapshots(entries):
+    # yield (step, full state summary) for every snapshot or delta entry of a log
+    current = None
+    for entry in entries:
+        if entry['type'] == 'snapshot':
+            current = dict(entry['state'])
+        elif entry['type'] == 'snapshot_delta':
+            if current is None:
+                raise ValueError(f"Delta snapshot at step {entry['step']} precedes the first keyframe")
+            current.update(entry['state'])
+        else:
+            continue
+        yield entry['step'], dict(current)
+        
+def state_at(entries, step):
+    # full state summary as of the last snapshot taken at or before step
+    state = None
+    for snapshot_step, snapshot in rebuild_snapshots(entries):
+        if snapshot_step > step:
+            break
+        state = snapshot
+    return state
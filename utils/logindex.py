@@ -0,0 +1,259 @@
+# utils/logindex.py
+#
+# On-disk index of a JSONL log (SimulationLogger with a .jsonl sink), written next to it
+# as <log>.idx plus a JSON sidecar like utils/binlog.py. The index holds the byte offset
+# and step of every entry and sorted postings (entry numbers) per pid, peer, type and
+# round, so a query reads only the lines it returns:
+#
+#   index = LogIndex.open("run.jsonl")  #builds the index if it is missing or stale
+#   index.entries(pid="P7", round=12, type=RECEIVE_TYPES)
+#   index.entries(type="decide_final", steps=(5000, 6000))
+#   index.first_step_all_reached(12)
+#
+# pid/peer/round are read off an entry the same way the binary log does (_entry_fields):
+# a send is indexed under its sender as pid and its receiver ('*' for a broadcast) as
+# peer, a receive under the receiving process and the message round.
+
+from array import array
+from bisect import bisect_left, bisect_right
+import heapq
+import json
+import mmap
+import os
+import sys
+
+from utils.binlog import NO_ROUND, _entry_fields, meta_path
+
+RECEIVE_TYPES = ('receive_vote', 'receive_decision')
+FIELDS = ('pid', 'peer', 'type', 'round')
+
+def index_path(log_path):
+    return log_path + ".idx"
+
+def _key(field, value):
+    return f"{field}:{value}"
+
+def build_index(log_path):
+    # one pass over the log; returns the LogIndex
+    if not log_path.endswith(".jsonl"):
+        raise ValueError(f"Only .jsonl logs can be indexed: {log_path}")
+    offsets = array('Q')
+    steps = array('I')
+    postings = {} #key -> array of entry numbers, ascending
+    reached = {} #pid -> {round: step of the advance_round into it}
+    pids = None
+
+    offset = 0
+    with open(log_path, "rb") as f:
+        for line in f:
+            start = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            number = len(offsets)
+            offsets.append(start)
+            steps.append(entry['step'])
+            kind = entry['type']
+
+            if kind == 'snapshot':
+                if pids is None:
+                    pids = list(entry['state'])
+                postings.setdefault(_key('type', kind), array('I')).append(number)
+                continue
+            pid, peer, rnd, _ = _entry_fields(entry)
+            for field, value in (('pid', pid), ('peer', peer), ('type', kind)):
+                if value is not None:
+                    postings.setdefault(_key(field, value), array('I')).append(number)
+            if rnd != NO_ROUND:
+                postings.setdefault(_key('round', rnd), array('I')).append(number)
+            if kind == 'advance_round':
+                reached.setdefault(pid, {}).setdefault(entry['new_round'], entry['step'])
+
+    if pids is None:
+        pids = sorted({key[4:] for key in postings if key.startswith('pid:')})
+
+    directory = {}
+    position = 0
+    path = index_path(log_path)
+    with open(path, "wb") as f:
+        # offsets first so every column starts aligned to its item size
+        for values in (offsets, steps, *postings.values()):
+            if sys.byteorder == 'big':
+                values = array(values.typecode, values)
+                values.byteswap()
+            f.write(values.tobytes())
+        for key, values in postings.items():
+            directory[key] = [position, len(values)]
+            position += len(values)
+    stat = os.stat(log_path)
+    with open(meta_path(path), "w", encoding="utf-8") as f:
+        json.dump({
+            'log_size': stat.st_size,
+            'log_mtime': stat.st_mtime,
+            'entries': len(offsets),
+            'pids': pids,
+            'postings': directory,
+            'reached': reached
+        }, f)
+    return LogIndex(log_path)
+
+class LogIndex:
+    # read side: the index file is memory-mapped, postings are slices of it
+    def __init__(self, log_path):
+        self.log_path = log_path
+        path = index_path(log_path)
+        with open(meta_path(path), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.meta = meta
+        self.pids = meta['pids']
+        self.directory = meta['postings']
+        self.reached = {pid: {int(r): step for r, step in rounds.items()} for pid, rounds in meta['reached'].items()}
+
+        count = meta['entries']
+        with open(path, "rb") as f:
+            if sys.byteorder == 'little' and os.path.getsize(path):
+                self._data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                self.offsets = self._data[:8 * count].cast('Q')
+                self.steps = self._data[8 * count:12 * count].cast('I')
+                self._postings = self._data[12 * count:].cast('I')
+            else:
+                self.offsets, self.steps, self._postings = array('Q'), array('I'), array('I')
+                self.offsets.fromfile(f, count)
+                self.steps.fromfile(f, count)
+                self._postings.frombytes(f.read())
+                if sys.byteorder == 'big':
+                    for values in (self.offsets, self.steps, self._postings):
+                        values.byteswap()
+        self._log = None
+
+    @staticmethod
+    def open(log_path):
+        # load the index of log_path, (re)building it first if it is missing or older than the log
+        try:
+            with open(meta_path(index_path(log_path)), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            stat = os.stat(log_path)
+            if meta['log_size'] == stat.st_size and meta['log_mtime'] == stat.st_mtime:
+                return LogIndex(log_path)
+        except (OSError, ValueError, KeyError):
+            pass
+        return build_index(log_path)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def postings(self, field, value):
+        # ascending entry numbers with field == value (empty if there are none)
+        start, count = self.directory.get(_key(field, value), (0, 0))
+        return self._postings[start:start + count]
+
+    def step_range(self, start=None, end=None):
+        # entry numbers [lo, hi) of the entries with start <= step <= end
+        lo = 0 if start is None else bisect_left(self.steps, start)
+        hi = len(self.steps) if end is None else bisect_right(self.steps, end)
+        return lo, hi
+
+    def select(self, type=None, pid=None, peer=None, round=None, steps=None):
+        # entry numbers matching every given filter, ascending. Each filter is a value or a
+        # collection of values (any of them matches); steps is a (start, end) pair, both inclusive
+        lo, hi = self.step_range(*steps) if steps is not None else (0, len(self))
+        filters = []
+        for field, value in zip(FIELDS, (pid, peer, type, round)):
+            if value is None:
+                continue
+            values = [value] if isinstance(value, (str, int)) else value
+            lists = []
+            for v in values:
+                posting = self.postings(field, v)
+                posting = posting[bisect_left(posting, lo):bisect_left(posting, hi)]
+                if len(posting):
+                    lists.append(posting)
+            if not lists:
+                return
+            filters.append(lists)
+        if not filters:
+            yield from range(lo, hi)
+            return
+
+        # walk the shortest filter, probe the others by bisection
+        filters.sort(key=lambda lists: sum(len(p) for p in lists))
+        driver, rest = filters[0], filters[1:]
+        candidates = driver[0] if len(driver) == 1 else heapq.merge(*driver)
+        for number in candidates:
+            if all(any(_contains(p, number) for p in lists) for lists in rest):
+                yield number
+
+    def entry(self, number):
+        # one log entry, read by seeking to its line
+        if self._log is None:
+            self._log = open(self.log_path, "rb")
+        self._log.seek(self.offsets[number])
+        return json.loads(self._log.readline())
+
+    def entries(self, type=None, pid=None, peer=None, round=None, steps=None):
+        for number in self.select(type, pid, peer, round, steps):
+            yield self.entry(number)
+
+    def count(self, type=None, pid=None, peer=None, round=None, steps=None):
+        # number of matching entries; reads nothing from the log
+        if steps is None and sum(v is not None for v in (type, pid, peer, round)) == 1:
+            for field, value in zip(FIELDS, (pid, peer, type, round)):
+                if isinstance(value, (str, int)):
+                    return len(self.postings(field, value))
+        return sum(1 for _ in self.select(type, pid, peer, round, steps))
+
+    def first_step_all_reached(self, round):
+        # step of the advance_round that brought the last process into round, or None if
+        # some process never got there (a decided process stops advancing)
+        if round <= 1:
+            return self.steps[0] if len(self) else None
+        steps = []
+        for pid in self.pids:
+            step = self.reached.get(pid, {}).get(round)
+            if step is None:
+                return None
+            steps.append(step)
+        return max(steps)
+
+def _contains(posting, number):
+    i = bisect_left(posting, number)
+    return i < len(posting) and posting[i] == number
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query a .jsonl simulation log through its index.")
+    parser.add_argument("log_path")
+    parser.add_argument("--type", action="append", help="entry type (repeatable)")
+    parser.add_argument("--pid", action="append", help="acting/receiving process (repeatable)")
+    parser.add_argument("--peer", action="append", help="other end of a send or receive (repeatable)")
+    parser.add_argument("--round", type=int, action="append", help="round (repeatable)")
+    parser.add_argument("--start", type=int, help="first step")
+    parser.add_argument("--end", type=int, help="last step")
+    parser.add_argument("--count", action="store_true", help="print only the number of matches")
+    parser.add_argument("--reached", type=int, metavar="R", help="first step at which every process is in round R")
+    args = parser.parse_args()
+
+    with LogIndex.open(args.log_path) as index:
+        if args.reached is not None:
+            print(index.first_step_all_reached(args.reached))
+        else:
+            query = dict(type=args.type, pid=args.pid, peer=args.peer, round=args.round,
+                         steps=(args.start, args.end) if args.start is not None or args.end is not None else None)
+            if args.count:
+                print(index.count(**query))
+            else:
+                for entry in index.entries(**query):
+                    print(json.dumps(entry, separators=(",", ":"), ensure_ascii=False))
@@ -0,0 +1,139 @@
+# utils/replay.py
+#
+# Deterministic replay of simulate_ben_or runs. A ScheduleRecord captures everything the
+# random scheduler and the handler's coins decided: which receiver got which queue
+# index at every step, and every coin outcome. Replaying feeds those back through the
+# run_steps scheduler hook and a scripted coin, so the replay never depends on how many
+# draws the rng made. Logging stays off while fast-forwarding and turns on at step K.
+
+from array import array
+import copy
+import json
+import sys
+
+from utils.binlog import BinaryLogWriter, meta_path
+from utils.logger import SimulationLogger
+from utils.schedule import Scheduler
+
+NO_MESSAGE = -1 #index of a step where the polled receiver got nothing
+
+class RecordingCoin:
+    # wraps config.rng for the handler's coin flips and appends each outcome to coins
+    def __init__(self, rng, coins):
+        self.rng = rng
+        self.coins = coins
+
+    def choice(self, seq):
+        value = self.rng.choice(seq)
+        self.coins.append(seq.index(value))
+        return value
+
+    def __copy__(self):
+        # forks (Configuration.fork) flip their own coins without recording them
+        return copy.copy(self.rng)
+
+class ScriptedCoin:
+    # replays recorded coin outcomes in order
+    def __init__(self, coins):
+        self.coins = coins
+        self.position = 0
+
+    def choice(self, seq):
+        value = seq[self.coins[self.position]]
+        self.position += 1
+        return value
+
+class ScheduleRecord:
+    # compact schedule: 2 + 4 bytes per step and 1 byte per coin flip
+    def __init__(self, pids=(), meta=None):
+        self.pids = list(pids)
+        self.pid_ids = {pid: i for i, pid in enumerate(self.pids)}
+        self.meta = dict(meta or {})
+        self.receivers = array('H')
+        self.indices = array('i')
+        self.coins = array('b')
+
+    def attach(self, config, **meta):
+        # start recording a run of config; meta must hold what build_ben_or needs (n, t, seed)
+        self.pids = list(config.processes)
+        self.pid_ids = {pid: i for i, pid in enumerate(self.pids)}
+        self.meta.update(meta)
+        config.rng = RecordingCoin(config.rng, self.coins)
+
+    def delivery(self, pid, index):
+        self.receivers.append(self.pid_ids[pid])
+        self.indices.append(NO_MESSAGE if index is None else index)
+
+    def __len__(self):
+        return len(self.receivers)
+
+    def step(self, i):
+        # (pid, index) of step i, index None for a step without delivery
+        index = self.indices[i]
+        return self.pids[self.receivers[i]], (None if index == NO_MESSAGE else index)
+
+    def save(self, path):
+        # raw little-endian arrays; sizes and pids go to a JSON sidecar like utils/binlog.py
+        with open(path, "wb") as f:
+            for values in (self.receivers, self.indices, self.coins):
+                if sys.byteorder == 'big':
+                    values = array(values.typecode, values)
+                    values.byteswap()
+                f.write(values.tobytes())
+        with open(meta_path(path), "w", encoding="utf-8") as f:
+            json.dump({**self.meta, 'pids': self.pids, 'steps': len(self), 'coins': len(self.coins)}, f)
+
+    @staticmethod
+    def load(path):
+        with open(meta_path(path), encoding="utf-8") as f:
+            meta = json.load(f)
+        record = ScheduleRecord(meta.pop('pids'))
+        steps, coins = meta.pop('steps'), meta.pop('coins')
+        record.meta = meta
+        with open(path, "rb") as f:
+            for values, count in ((record.receivers, steps), (record.indices, steps), (record.coins, coins)):
+                values.frombytes(f.read(count * values.itemsize))
+                if sys.byteorder == 'big':
+                    values.byteswap()
+        return record
+
+class ReplayScheduler(Scheduler):
+    # run_steps scheduler that follows a ScheduleRecord and enables logging at step log_from
+    def __init__(self, record, logger, log_from=0):
+        self.record = record
+        self.logger = logger
+        self.log_from = log_from
+        self.position = 0
+
+    def next_event(self, config):
+        if self.position >= len(self.record):
+            return None
+        if self.position == self.log_from and not self.logger.enabled:
+            self.logger.enabled = True
+            self.logger.log_event({"type": "replay_from", "from_step": self.log_from})
+        step = self.record.step(self.position)
+        self.position += 1
+        return step
+
+def replay(record, log_from=0, until=None, log_path="replay_log.jsonl", delay=None, log_categories=None):
+    # re-execute a recorded run, logging only steps log_from..until. delay must be the
+    # distribution the run was recorded with (None for the untimed message system)
+    from main import build_ben_or, run_steps, summarize_run
+
+    meta = record.meta
+    streaming = log_path is not None and log_path.endswith((".jsonl", ".bin"))
+    sink = None
+    if streaming:
+        sink = BinaryLogWriter(log_path) if log_path.endswith(".bin") else log_path
+    logger = SimulationLogger(enabled=log_from == 0, sink=sink, categories=log_categories)
+
+    try:
+        config, handler_args = build_ben_or(meta['n'], meta['t'], meta['seed'], delay, logger)
+        config.rng = ScriptedCoin(record.coins)
+        steps = len(record) if until is None else min(until, len(record))
+        steps = run_steps(config, handler_args, steps, logger, scheduler=ReplayScheduler(record, logger, log_from))
+        if not streaming and log_path is not None:
+            logger.export_as_json(log_path)
+    finally:
+        logger.close()
+    return summarize_run(config, steps, meta['seed'])
@@ -0,0 +1,265 @@
+# utils/schedule.py
+#
+# Delivery policies for run_steps / simulate_ben_or. A scheduler's next_event(config)
+# returns (pid, index) to deliver the index-th pending message of pid, (pid, None) for
+# a step in which pid receives nothing, or None to stop the run. attach(config) is
+# called by build_ben_or before the initial broadcast, so schedulers that follow sends
+# (global FIFO, weighted links) see every message from the start.
+# Without a scheduler, run_steps keeps its built-in random polling (PollingScheduler).
+
+from collections import deque
+import random
+
+class Scheduler:
+    def attach(self, config):
+        pass
+
+    def next_event(self, config):
+        raise NotImplementedError
+
+class PollingScheduler(Scheduler):
+    # the built-in policy: a uniformly chosen ready receiver gets its oldest message
+    # with probability p, nothing otherwise. Draws from the run's rng like run_steps does
+    def __init__(self, p=0.7):
+        self.p = p
+
+    def next_event(self, config):
+        message_system = config.message_system
+        target = message_system.choose_ready()
+        if target is None:
+            return None
+        return target, (0 if message_system.rng.random() < self.p else None)
+
+class UniformScheduler(Scheduler):
+    # fair random: every step delivers the oldest message of a uniformly chosen ready receiver
+    def next_event(self, config):
+        target = config.message_system.choose_ready()
+        return None if target is None else (target, 0)
+
+class RoundRobinScheduler(Scheduler):
+    # cycles through the processes in pid order, skipping those with nothing pending
+    def __init__(self):
+        self.pids = None
+        self.position = 0
+
+    def attach(self, config):
+        self.pids = list(config.processes)
+        self.position = 0
+
+    def next_event(self, config):
+        if self.pids is None:
+            self.attach(config)
+        message_system = config.message_system
+        n = len(self.pids)
+        for k in range(n):
+            pid = self.pids[(self.position + k) % n]
+            if message_system.pending(pid):
+                self.position = (self.position + k + 1) % n
+                return pid, 0
+        return None
+
+class FifoScheduler(Scheduler):
+    # global FIFO: messages are delivered in the order they were sent, across all receivers.
+    # Every send is remembered as (receiver, message). Per-receiver queues are FIFO, so the
+    # message heads its queue unless advance_floor dropped it; a DelayedMessageSystem orders
+    # each receiver's messages by due time instead, so there it is looked up by position
+    def __init__(self):
+        self.order = deque()
+        self.system = None
+        self.timed = False
+
+    def attach(self, config):
+        # messages already in flight are taken one per receiver in turn
+        from base.message_system import DelayedMessageSystem
+
+        message_system = config.message_system
+        self.timed = isinstance(message_system, DelayedMessageSystem)
+        self.order = deque()
+        queues = {r: list(message_system.peek_buffer(r)) for r in message_system.all_receivers()}
+        while any(queues.values()):
+            for receiver in queues:
+                if queues[receiver]:
+                    self.order.append((receiver, queues[receiver].pop(0)))
+        message_system.send_hooks.append(self.on_send)
+        self.system = message_system
+
+    def on_send(self, receiver, message):
+        self.order.append((receiver, message))
+
+    def next_event(self, config):
+        if self.system is not config.message_system:
+            self.attach(config)
+        message_system = config.message_system
+        while self.order:
+            receiver, message = self.order.popleft()
+            queue = message_system.peek_buffer(receiver)
+            if not self.timed:
+                if queue and queue[0] == message:
+                    return receiver, 0
+                continue # dropped by advance_floor after it was sent
+            try:
+                return receiver, queue.index(message)
+            except ValueError:
+                continue
+        return None
+
+class _LinkTree:
+    # Fenwick tree of link weights: O(log L) updates and weighted draws over L links
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0.0] * (size + 1)
+
+    def add(self, i, delta):
+        i += 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, u):
+        # index of the link whose cumulative weight range contains u
+        pos = 0
+        step = 1 << self.size.bit_length()
+        tree = self.tree
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and tree[nxt] <= u:
+                pos = nxt
+                u -= tree[nxt]
+            step >>= 1
+        return min(pos, self.size - 1)
+
+class WeightedLinkScheduler(Scheduler):
+    # picks a link (sender, receiver) with pending messages with probability proportional
+    # to weights.get(link, default) and delivers the oldest message on it.
+    # Draws from the run's rng unless a seed of its own is given.
+    # Links with pending messages carry their weight in a Fenwick tree, and every link
+    # keeps its undelivered messages in send order, so a step costs O(log n) plus one
+    # C-level search of the receiver's queue
+    def __init__(self, weights=None, default=1.0, seed=None):
+        self.weights = dict(weights or {})
+        self.default = default
+        self.rng = random.Random(seed) if seed is not None else None
+        self.system = None
+
+    def attach(self, config):
+        message_system = config.message_system
+        n = len(config.processes)
+        self.tree = _LinkTree(max(1, n * n))
+        self.total = 0.0
+        self.active = 0 #links with pending messages and a positive weight
+        self.ids = {} #(sender, receiver) -> position in the tree
+        self.links = [] #position -> (sender, receiver)
+        self.queues = [] #position -> messages sent on the link and not yet delivered, oldest first
+        for receiver in message_system.all_receivers():
+            for message in message_system.peek_buffer(receiver):
+                self.on_send(receiver, message)
+        message_system.send_hooks.append(self.on_send)
+        self.system = message_system
+
+    def _weight(self, link):
+        return self.weights.get(link, self.default)
+
+    def on_send(self, receiver, message):
+        link = (message[0], receiver)
+        i = self.ids.get(link)
+        if i is None:
+            i = self.ids[link] = len(self.links)
+            self.links.append(link)
+            self.queues.append(deque())
+        queue = self.queues[i]
+        queue.append(message)
+        if len(queue) == 1:
+            self._set_active(i, True)
+
+    def _set_active(self, i, active):
+        weight = self._weight(self.links[i])
+        if weight <= 0:
+            return
+        if not active:
+            weight = -weight
+            self.active -= 1
+        else:
+            self.active += 1
+        self.tree.add(i, weight)
+        self.total += weight
+
+    def _rebuild(self):
+        # float drift in the running sums: recompute them from the link queues
+        self.tree = _LinkTree(self.tree.size)
+        self.total = 0.0
+        self.active = 0
+        for i, queue in enumerate(self.queues):
+            if queue:
+                self._set_active(i, True)
+
+    def next_event(self, config):
+        if self.system is not config.message_system:
+            self.attach(config)
+        message_system = config.message_system
+        rng = self.rng or message_system.rng
+        while self.active:
+            i = self.tree.find(rng.random() * self.total)
+            queue = self.queues[i] if i < len(self.queues) else None
+            if not queue or self._weight(self.links[i]) <= 0:
+                self._rebuild()
+                continue
+            sender, receiver = self.links[i]
+            message = queue.popleft()
+            if not queue:
+                self._set_active(i, False)
+            try:
+                return receiver, message_system.peek_buffer(receiver).index(message)
+            except ValueError:
+                # the message left the queue some other way (advance_floor): draw again
+                continue
+        return None
+
+class StarveScheduler(Scheduler):
+    # uniform over ready receivers except `pid`, which receives nothing for the first
+    # `steps` steps (forever when steps is None). A starved process looks crashed to the rest
+    def __init__(self, pid, steps=None):
+        self.pid = pid
+        self.steps = steps
+        self.step = 0
+
+    def next_event(self, config):
+        message_system = config.message_system
+        self.step += 1
+        if self.steps is not None and self.step > self.steps:
+            target = message_system.choose_ready()
+            return None if target is None else (target, 0)
+        ready = message_system.ready_receivers()
+        if self.pid in ready:
+            ready.remove(self.pid)
+        if not ready:
+            return None
+        return ready[message_system.rng.randrange(len(ready))], 0
+
+class TimedScheduler(Scheduler):
+    # discrete-event order for a DelayedMessageSystem: always the earliest due message.
+    # take(next_receiver(), 0) removes the head of the heap and of that receiver's list,
+    # like next_delivery(), so this runs as fast as the built-in timed mode
+    def next_event(self, config):
+        target = config.message_system.next_receiver()
+        return None if target is None else (target, 0)
+
+SCHEDULERS = {
+    'polling': PollingScheduler,
+    'uniform': UniformScheduler,
+    'round_robin': RoundRobinScheduler,
+    'fifo': FifoScheduler,
+    'weighted': WeightedLinkScheduler
+}
+
+def compare_schedulers(factories=None, seeds=range(1000), n=3, t=1, rounds=300, workers=None):
+    # batch statistics (utils/batch.py) of the same seeds under each scheduler
+    from utils.batch import run_batch
+
+    factories = factories or SCHEDULERS
+    return {name: run_batch(seeds, n=n, t=t, rounds=rounds, workers=workers, scheduler=factory)
+            for name, factory in factories.items()}
+
+if __name__ == "__main__":
+    for name, summary in compare_schedulers().items():
+        print(f"{name:12} decided {summary['decided']}/{summary['runs']}  "
+              f"mean steps to decision {summary['mean_steps_to_decision']}")
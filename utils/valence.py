@@ -0,0 +1,117 @@
+# utils/valence.py
+#
+# Monte Carlo valence estimation for configurations too large to explore exhaustively
+# (see utils/explorer.py). The configuration is forked and driven to completion many
+# times under ben_or_handler with independent random schedules and coins. The fractions
+# of continuations that decide 0 or 1 estimate how close the configuration is to being
+# univalent.
+
+from concurrent.futures import ProcessPoolExecutor
+import random
+
+from base.message_system import DelayedMessageSystem
+from main import run_steps, simulate_ben_or
+from utils.logger import SimulationLogger
+
+def _run_continuations(config, handler_args, seeds, max_steps):
+    # top-level so it can be pickled into worker processes; returns [#0, #1, #undecided, #violations]
+    counts = [0, 0, 0, 0]
+    logger = SimulationLogger(enabled=False)
+    for seed in seeds:
+        fork = config.fork()
+        fork.monitor.check = False #violations are counted below, not raised
+        rng = random.Random(seed)
+        fork.rng = fork.message_system.rng = rng
+        if isinstance(fork.message_system, DelayedMessageSystem):
+            #fresh delays too, so a continuation depends only on its seed and the timing key
+            fork.message_system.delay_rng = random.Random(rng.getrandbits(64))
+        run_steps(fork, handler_args, max_steps, logger)
+        values = fork.decision_values()
+        if len(values) > 1:
+            counts[3] += 1
+        elif values:
+            counts[next(iter(values))] += 1
+        else:
+            counts[2] += 1
+    return counts
+
+class ValenceEstimator:
+    def __init__(self, handler_args, samples=1000, max_steps=10000, workers=1, seed=0):
+        # each estimate uses `samples` continuations of at most max_steps deliveries
+        self.handler_args = handler_args
+        self.samples = samples
+        self.max_steps = max_steps
+        self.workers = workers
+        self.seed = seed
+        self.cache = {} #(fingerprint, timing, samples) -> estimate
+        self.hits = 0
+        self.pool = None #worker pool, started on the first parallel estimate
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def estimate(self, config, samples=None):
+        samples = samples or self.samples
+        # on a timed system the same states and buffers can still be due at different times
+        key = (config.fingerprint(), config.message_system.timing(), samples)
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+
+        # seeds depend only on the estimator seed, so a cached and a fresh estimate agree
+        seed_rng = random.Random(self.seed)
+        seeds = [seed_rng.getrandbits(64) for _ in range(samples)]
+        if self.workers > 1:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            chunks = [seeds[i::self.workers] for i in range(self.workers)]
+            parts = self.pool.map(_run_continuations, [config] * len(chunks),
+                                  [self.handler_args] * len(chunks), chunks, [self.max_steps] * len(chunks))
+            counts = [sum(c) for c in zip(*parts)]
+        else:
+            counts = _run_continuations(config, self.handler_args, seeds, self.max_steps)
+
+        p0, p1 = counts[0] / samples, counts[1] / samples
+        result = {
+            'samples': samples,
+            'p0': p0,
+            'p1': p1,
+            'p_undecided': counts[2] / samples,
+            'violations': counts[3],
+            # variance of the estimates themselves (Bernoulli p(1-p)/samples)
+            'var_p0': p0 * (1 - p0) / samples,
+            'var_p1': p1 * (1 - p1) / samples
+        }
+        self.cache[key] = result
+        return result
+
+def estimate_valence(config, samples=1000, handler_args=None, max_steps=10000, workers=1, estimator=None):
+    # one-off estimate; pass a ValenceEstimator to share its cache across calls.
+    # handler_args defaults to the {'n', 't'} build_ben_or stored on the configuration
+    if estimator is not None:
+        return estimator.estimate(config, samples)
+    handler_args = handler_args or config.handler_args
+    if handler_args is None:
+        raise ValueError("estimate_valence needs handler_args ({'n': ..., 't': ...}) for a configuration "
+                         "not built by main.build_ben_or")
+    with ValenceEstimator(handler_args, samples=samples, max_steps=max_steps, workers=workers) as estimator:
+        return estimator.estimate(config, samples)
+
+def valence_over_run(n=3, t=1, rounds=300, seed=None, samples=200, every=1, workers=1):
+    # (step, estimate) along one simulate_ben_or run: "bivalence over time"
+    trace = []
+    with ValenceEstimator({'n': n, 't': t}, samples=samples, workers=workers) as estimator:
+        def on_step(config, step):
+            if step % every == 0:
+                # forks get their own rng, so estimating never perturbs the run itself
+                trace.append((step, estimator.estimate(config)))
+        simulate_ben_or(n=n, t=t, rounds=rounds, seed=seed, log_enabled=False, log_path=None, on_step=on_step)
+    return trace
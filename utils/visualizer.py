@@ -1,93 +1,406 @@
-# Re-execute necessary context after reset
-import json
-import matplotlib.pyplot as plt
-from matplotlib.patches import FancyArrowPatch
-from matplotlib.animation import FuncAnimation, PillowWriter, FFMpegWriter
-import numpy as np
-
-# Load simulation log
-with open("simulation_log.json", "r", encoding="utf-8") as f:
-    simulation_log = json.load(f)
-
-# Extract process IDs
-process_ids = []
-for entry in simulation_log:
-    if entry['type'] == 'snapshot':
-        process_ids = list(entry['state'].keys())
-        break
-
-n = len(process_ids)
-angle_step = 2 * np.pi / n
-node_positions = {
-    pid: (np.cos(i * angle_step), np.sin(i * angle_step))
-    for i, pid in enumerate(process_ids)
-}
-
-# Preprocess arrows per step
-arrow_logs_by_step = {}
-for entry in simulation_log:
-    if entry['type'].startswith('send') and 'from' in entry and 'to' in entry:
-        label = entry['type']
-        if 'value' in entry:
-            label += f" ({entry['value']})"
-        arrow_logs_by_step.setdefault(entry['step'], []).append({
-            'from': entry['from'],
-            'to': entry['to'],
-            'label': label
-        })
-
-# Collect frames
-frames = []
-for entry in simulation_log:
-    if entry['type'] == 'snapshot':
-        frames.append({
-            'step': entry['step'],
-            'title': f"Step {entry['step']}",
-            'states': entry['state'],
-            'arrows': arrow_logs_by_step.get(entry['step'], [])
-        })
-
-# Draw function
-def draw_frame(frame_data, ax):
-    ax.clear()
-    ax.set_xlim(-1.8, 1.8)
-    ax.set_ylim(-1.8, 1.8)
-    ax.set_aspect('equal')
-    ax.axis('off')
-    ax.set_title(frame_data['title'], fontsize=16)
-
-    for pid, (x, y) in node_positions.items():
-        state = frame_data['states'][pid]
-        color = 'lightgray' if state['y'] == 'b' else ('skyblue' if state['y'] == 0 else 'salmon')
-        round_info = state.get('round', state['state'].get('round', '?'))
-        ax.plot(x, y, 'o', markersize=30, color=color)
-        text = f"{pid}\nx={state['x']}, y={state['y']}, r={round_info}"
-        ax.text(x, y - 0.2, text, ha='center', fontsize=9)
-
-    for arrow in frame_data.get('arrows', []):
-        src = arrow['from']
-        dst = arrow['to']
-        label = arrow['label']
-        if src in node_positions and dst in node_positions:
-            sx, sy = node_positions[src]
-            dx, dy = node_positions[dst]
-            ax.annotate(
-                '', xy=(dx, dy), xytext=(sx, sy),
-                arrowprops=dict(arrowstyle='->', color='gray', lw=1.5)
-            )
-            mid_x = (sx + dx) / 2
-            mid_y = (sy + dy) / 2
-            ax.text(mid_x, mid_y, label, fontsize=8, ha='center', va='center')
-
-# Animate
-fig, ax = plt.subplots(figsize=(6, 6))
-ani = FuncAnimation(fig, lambda i: draw_frame(frames[i], ax), frames=len(frames), interval=1000, repeat=False)
-
-# Save
-gif_path = "ben_or_simulation.gif"
-mp4_path = "ben_or_simulation.mp4"
-
-ani.save(gif_path, writer=PillowWriter(fps=1))
-ani.save(mp4_path, writer=FFMpegWriter(fps=1))
-
-gif_path, mp4_path
+# utils/visualizer.py
+#
+# Animation of a simulation log. Frames are streamed from the log one at a time
+# (iter_frames), so only the current state is ever held in memory. Worker processes
+# rasterize chunks of frames to PNG with the Agg backend (iter_pngs) and a single pass
+# encodes them into every requested output (encode). Past LARGE_N processes the
+# circle of nodes and arrows gives way to a state raster and a message heat matrix
+# (GridRenderer). matplotlib, NumPy and Pillow are imported only when rendering.
+#
+#   python utils/visualizer.py simulation_log.json -o ben_or_simulation.gif ben_or_simulation.mp4
+#   python utils/visualizer.py run.jsonl -o window.gif --start 5000 --end 6000 --every 10
+
+from collections import deque
+import argparse
+import io
+import math
+import os
+import subprocess
+import sys
+
+if __name__ == "__main__":
+    # run as a script: make the repo root importable (importing the module leaves sys.path alone)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.logger import read_log
+
+def iter_frames(log_path, step_range=None, every=1):
+    # yield one frame per snapshot of the log: {'step', 'title', 'states', 'arrows'}.
+    # step_range=(start, end) keeps snapshots with start <= step <= end (either may be None),
+    # every=k keeps every k-th of those. Arrows are the sends logged since the previous snapshot
+    start, end = step_range or (None, None)
+    current = None
+    process_ids = []
+    arrows = []
+    kept = 0
+    for entry in read_log(log_path):
+        kind = entry['type']
+        if kind.startswith('send') and 'from' in entry and 'to' in entry:
+            label = kind
+            if 'value' in entry:
+                label += f" ({entry['value']})"
+            arrows.append((entry['from'], entry['to'], label))
+            continue
+        if kind == 'snapshot':
+            current = dict(entry['state'])
+            process_ids = list(current)
+        elif kind == 'snapshot_delta':
+            if current is None:
+                raise ValueError(f"Delta snapshot at step {entry['step']} precedes the first keyframe")
+            current.update(entry['state'])
+        else:
+            continue
+
+        step = entry['step']
+        if start is not None and step < start:
+            arrows = []
+            continue
+        if end is not None and step > end:
+            break
+        kept += 1
+        if (kept - 1) % every:
+            continue #sends keep accumulating into the next drawn frame
+        sends, arrows = arrows, []
+        frame_arrows = []
+        for src, dst, label in sends:
+            # a broadcast ("to": "*") is drawn as one arrow to every other process
+            targets = [p for p in process_ids if p != src] if dst == '*' else [dst]
+            frame_arrows.extend({'from': src, 'to': target, 'label': label} for target in targets)
+        yield {
+            'step': step,
+            'title': f"Step {step}",
+            'states': dict(current),
+            'arrows': frame_arrows
+        }
+
+def log_process_ids(log_path):
+    # process ids of the first keyframe of a log
+    for entry in read_log(log_path):
+        if entry['type'] == 'snapshot':
+            return list(entry['state'])
+    return []
+
+def iter_grid_frames(log_path, step_range=None, every=1):
+    # array frames for the large-n mode: {'step', 'codes', 'rounds', 'sends'} with
+    # codes[i] = STATE_CODES of process i, rounds[i] its round, and sends an (m, 2) array
+    # of (sender, receiver) indices for the sends since the last drawn frame, receiver -1
+    # for a broadcast. Snapshot deltas touch only the changed entries
+    import numpy as np
+
+    start, end = step_range or (None, None)
+    index = None
+    codes = rounds = None
+    sends = [] #(sender, receiver) pairs, or (sender, pid) pairs before the first keyframe
+    kept = 0
+    for entry in read_log(log_path):
+        kind = entry['type']
+        if kind.startswith('send') and 'from' in entry and 'to' in entry:
+            sends.append((entry['from'], entry['to']))
+            continue
+        if kind not in ('snapshot', 'snapshot_delta'):
+            continue
+        if index is None:
+            if kind != 'snapshot':
+                raise ValueError(f"Delta snapshot at step {entry['step']} precedes the first keyframe")
+            index = {pid: i for i, pid in enumerate(entry['state'])}
+            codes = np.zeros(len(index), dtype=np.int8)
+            rounds = np.ones(len(index), dtype=np.int32)
+        for pid, state in entry['state'].items():
+            i = index[pid]
+            codes[i] = STATE_CODES.get(state['y'], 0) if state.get('alive', True) else STATE_CODES['dead']
+            rounds[i] = state['state'].get('round', 1)
+
+        step = entry['step']
+        if start is not None and step < start:
+            sends = []
+            continue
+        if end is not None and step > end:
+            break
+        kept += 1
+        if (kept - 1) % every:
+            continue #sends keep accumulating into the next drawn frame
+        pairs = np.array([(index[src], -1 if dst == '*' else index[dst]) for src, dst in sends],
+                         dtype=np.int32).reshape(-1, 2)
+        sends = []
+        yield {
+            'step': step,
+            'codes': codes.copy(),
+            'rounds': rounds.copy(),
+            'sends': pairs
+        }
+
+def circle_layout(process_ids):
+    angle_step = 2 * math.pi / len(process_ids)
+    return {pid: (math.cos(i * angle_step), math.sin(i * angle_step)) for i, pid in enumerate(process_ids)}
+
+class FrameRenderer:
+    # one Agg figure per process: node markers, labels and title are created once and a
+    # frame only updates colors and changed texts and replaces the arrows
+    def __init__(self, process_ids, figsize=(6, 6), dpi=100):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.key = (tuple(process_ids), figsize, dpi)
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        ax = self.ax = self.fig.add_subplot()
+        ax.set_xlim(-1.8, 1.8)
+        ax.set_ylim(-1.8, 1.8)
+        ax.set_aspect('equal')
+        ax.axis('off')
+        self.title = ax.set_title("", fontsize=16)
+
+        self.process_ids = list(process_ids)
+        self.positions = circle_layout(self.process_ids)
+        xs = [self.positions[pid][0] for pid in self.process_ids]
+        ys = [self.positions[pid][1] for pid in self.process_ids]
+        self.colors = ['lightgray'] * len(xs)
+        self.nodes = ax.scatter(xs, ys, s=30 ** 2, c=self.colors, zorder=2)
+        self.labels = [ax.text(x, y - 0.2, "", ha='center', fontsize=9, zorder=3) for x, y in zip(xs, ys)]
+        self.arrows = [] #artists of the current frame's arrows
+
+    def draw(self, frame):
+        self.title.set_text(frame['title'])
+        colors = []
+        for pid, label in zip(self.process_ids, self.labels):
+            state = frame['states'][pid]
+            colors.append('lightgray' if state['y'] == 'b' else ('skyblue' if state['y'] == 0 else 'salmon'))
+            round_info = state.get('round', state['state'].get('round', '?'))
+            text = f"{pid}\nx={state['x']}, y={state['y']}, r={round_info}"
+            if label.get_text() != text:
+                label.set_text(text)
+        if colors != self.colors:
+            self.colors = colors
+            self.nodes.set_facecolors(colors)
+
+        for artist in self.arrows:
+            artist.remove()
+        self.arrows = []
+        for arrow in frame.get('arrows', []):
+            src, dst = arrow['from'], arrow['to']
+            if src in self.positions and dst in self.positions:
+                sx, sy = self.positions[src]
+                dx, dy = self.positions[dst]
+                self.arrows.append(self.ax.annotate(
+                    '', xy=(dx, dy), xytext=(sx, sy),
+                    arrowprops=dict(arrowstyle='->', color='gray', lw=1.5)
+                ))
+                self.arrows.append(self.ax.text((sx + dx) / 2, (sy + dy) / 2, arrow['label'],
+                                                fontsize=8, ha='center', va='center'))
+
+    def png(self):
+        buf = io.BytesIO()
+        self.fig.canvas.print_png(buf, pil_kwargs={"compress_level": 1}) #fast: the frames are re-encoded anyway
+        return buf.getvalue()
+
+STATE_CODES = {'b': 0, 0: 1, 1: 2, 'dead': 3}
+STATE_COLORS = ['white', 'lightgray', 'skyblue', 'salmon', 'dimgray'] #padding cell, then STATE_CODES order
+LARGE_N = 12 #mode='auto' switches to the grid renderer above this many processes
+
+class GridRenderer:
+    # large-n mode: process states as one raster (a cell per process, row-major in pid
+    # order) next to an n x n heat matrix of the messages sent since the previous frame.
+    # Both are single imshow artists, so a frame is a couple of set_data calls
+    def __init__(self, process_ids, figsize=(12, 6), dpi=100):
+        import numpy as np
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.colors import ListedColormap
+        from matplotlib.figure import Figure
+
+        self.np = np
+        self.key = (tuple(process_ids), figsize, dpi)
+        n = self.n = len(process_ids)
+        self.cols = math.ceil(math.sqrt(n))
+        self.rows = math.ceil(n / self.cols)
+        self.cells = np.zeros(self.rows * self.cols, dtype=np.int8) #padding cells stay 0
+        self.flow = np.zeros((n, n), dtype=np.int32)
+
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        grid_ax, flow_ax = self.fig.subplots(1, 2)
+        self.title = self.fig.suptitle("", fontsize=14)
+        self.grid = grid_ax.imshow(self.cells.reshape(self.rows, self.cols), cmap=ListedColormap(STATE_COLORS),
+                                   vmin=0, vmax=len(STATE_COLORS) - 1, interpolation='nearest')
+        grid_ax.set_title("process state (gray: undecided, blue: 0, red: 1)", fontsize=9)
+        grid_ax.set_xticks([])
+        grid_ax.set_yticks([])
+        self.heat = flow_ax.imshow(self.flow, cmap='Blues', vmin=0, vmax=1, interpolation='nearest')
+        flow_ax.set_title("messages sent since previous frame", fontsize=9)
+        flow_ax.set_xlabel("receiver")
+        flow_ax.set_ylabel("sender")
+        self.fig.colorbar(self.heat, ax=flow_ax, fraction=0.046)
+
+    def draw(self, frame):
+        np = self.np
+        codes, rounds, sends = frame['codes'], frame['rounds'], frame['sends']
+        self.cells[:self.n] = codes + 1
+        self.grid.set_data(self.cells.reshape(self.rows, self.cols))
+
+        flow = self.flow
+        flow.fill(0)
+        if len(sends):
+            senders, receivers = sends[:, 0], sends[:, 1]
+            direct = receivers >= 0
+            np.add.at(flow, (senders[direct], receivers[direct]), 1)
+            broadcasts = senders[~direct]
+            np.add.at(flow, broadcasts, 1) #a whole row per broadcast...
+            np.add.at(flow, (broadcasts, broadcasts), -1) #...except the sender itself
+        self.heat.set_data(flow)
+        self.heat.set_clim(0, max(1, int(flow.max())))
+
+        counts = np.bincount(codes, minlength=len(STATE_CODES))
+        self.title.set_text(f"Step {frame['step']}   undecided {counts[0]}   decided 0: {counts[1]}   "
+                            f"decided 1: {counts[2]}   rounds {rounds.min()}-{rounds.max()}")
+
+    def png(self):
+        buf = io.BytesIO()
+        self.fig.canvas.print_png(buf, pil_kwargs={"compress_level": 1})
+        return buf.getvalue()
+
+RENDERERS = {'circle': FrameRenderer, 'grid': GridRenderer}
+FRAME_SOURCES = {'circle': iter_frames, 'grid': iter_grid_frames}
+
+_renderer = None #per worker process, reused across the chunks it renders
+
+def _render_chunk(job):
+    # top-level so it can be pickled into worker processes; returns one PNG per frame
+    global _renderer
+    mode, process_ids, frames, figsize, dpi = job
+    if _renderer is None or not isinstance(_renderer, RENDERERS[mode]) or _renderer.key != (tuple(process_ids), figsize, dpi):
+        _renderer = RENDERERS[mode](process_ids, figsize, dpi)
+    pngs = []
+    for frame in frames:
+        _renderer.draw(frame)
+        pngs.append(_renderer.png())
+    return pngs
+
+def iter_pngs(log_path, step_range=None, every=1, workers=1, chunk_size=32, figsize=None, dpi=100, mode='auto'):
+    # PNG bytes of every selected frame, in order. With workers > 1 chunks of frames are
+    # rasterized in a process pool while the log is still being read; at most two chunks
+    # per worker are in flight, so memory stays bounded however long the run is.
+    # mode: 'circle', 'grid' (large n) or 'auto' (grid above LARGE_N processes)
+    process_ids = log_process_ids(log_path)
+    if mode == 'auto':
+        mode = 'grid' if len(process_ids) > LARGE_N else 'circle'
+    if mode not in RENDERERS:
+        raise ValueError(f"Unknown mode: {mode}")
+    figsize = figsize or ((12, 6) if mode == 'grid' else (6, 6))
+    frames = FRAME_SOURCES[mode](log_path, step_range, every)
+    if workers <= 1:
+        for frame in frames:
+            yield from _render_chunk((mode, process_ids, [frame], figsize, dpi))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        chunk = []
+        for frame in frames:
+            chunk.append(frame)
+            if len(chunk) == chunk_size:
+                in_flight.append(pool.submit(_render_chunk, (mode, process_ids, chunk, figsize, dpi)))
+                chunk = []
+                while len(in_flight) > 2 * workers:
+                    yield from in_flight.popleft().result()
+        if chunk:
+            in_flight.append(pool.submit(_render_chunk, (mode, process_ids, chunk, figsize, dpi)))
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+class GifWriter:
+    # animated GIF written one frame at a time: each frame is quantized on its own and
+    # stored with a local palette, so memory stays at one frame however long the run is
+    # (Pillow's save_all keeps every frame until it writes the file)
+    def __init__(self, path, fps=1):
+        from PIL import GifImagePlugin, Image
+
+        self.gif = GifImagePlugin
+        self.image = Image
+        self.duration = 1000 / fps
+        self.file = open(path, "wb")
+        self.started = False
+
+    def write(self, png):
+        frame = self.image.open(io.BytesIO(png)).convert("RGB").convert("P", palette=self.image.Palette.ADAPTIVE)
+        if not self.started:
+            for chunk in self.gif.getheader(frame, info={"loop": 0})[0]:
+                self.file.write(chunk)
+            self.started = True
+        for chunk in self.gif.getdata(frame, duration=self.duration, include_color_table=True):
+            self.file.write(chunk)
+
+    def close(self):
+        if self.started:
+            self.file.write(b";") #GIF trailer
+        self.file.close()
+
+def encode(pngs, outputs, fps=1):
+    # one pass over the frames feeds every output as it arrives: videos through an
+    # ffmpeg pipe each, GIFs through a GifWriter each. Returns the number of frames
+    gifs = [path for path in outputs if path.endswith(".gif")]
+    videos = [path for path in outputs if not path.endswith(".gif")]
+    for path in videos:
+        if not path.endswith((".mp4", ".mkv", ".webm", ".avi")):
+            raise ValueError(f"Unsupported output format: {path}")
+
+    # encoders start first: a missing ffmpeg fails before any .gif is created
+    encoders = []
+    writers = []
+    count = 0
+    done = False
+    try:
+        for path in videos:
+            encoders.append(subprocess.Popen(
+                ["ffmpeg", "-y", "-loglevel", "error", "-f", "image2pipe", "-framerate", str(fps), "-i", "-",
+                 "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", path],
+                stdin=subprocess.PIPE))
+        writers.extend(GifWriter(path, fps) for path in gifs)
+        for png in pngs:
+            for writer in writers:
+                writer.write(png)
+            for encoder in encoders:
+                encoder.stdin.write(png)
+            count += 1
+        done = True
+    finally:
+        for writer in writers:
+            writer.close()
+        for encoder, path in zip(encoders, videos):
+            if not done:
+                encoder.kill() #the error in flight is the one to report
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+            if encoder.wait() and done:
+                raise RuntimeError(f"ffmpeg failed to write {path}")
+    return count
+
+def render(log_path="simulation_log.json", outputs=("ben_or_simulation.gif",), step_range=None, every=1,
+           fps=1, dpi=100, workers=1, chunk_size=32, mode='auto'):
+    # rasterize the selected frames (in parallel with workers > 1) and encode them once
+    # into every output; returns the number of frames
+    pngs = iter_pngs(log_path, step_range, every, workers, chunk_size, dpi=dpi, mode=mode)
+    return encode(pngs, outputs, fps)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Animate a simulation log")
+    parser.add_argument("log_path", nargs="?", default="simulation_log.json", help=".json or .jsonl log")
+    parser.add_argument("-o", "--outputs", nargs="+", default=["ben_or_simulation.gif", "ben_or_simulation.mp4"],
+                        help="output files; the extension picks the writer (.gif, .mp4)")
+    parser.add_argument("--start", type=int, default=None, help="first log step to draw")
+    parser.add_argument("--end", type=int, default=None, help="last log step to draw")
+    parser.add_argument("--every", type=int, default=1, help="draw every k-th snapshot")
+    parser.add_argument("--fps", type=int, default=1)
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="rendering processes")
+    parser.add_argument("--mode", choices=["auto", "circle", "grid"], default="auto",
+                        help=f"grid: state raster + message heat matrix for large n (auto: above {LARGE_N} processes)")
+    args = parser.parse_args(argv)
+
+    count = render(args.log_path, args.outputs, (args.start, args.end), args.every, args.fps, args.dpi,
+                   args.workers, mode=args.mode)
+    print(f"{count} frames written to {', '.join(args.outputs)}")
+
+if __name__ == "__main__":
+    main()